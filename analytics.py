@@ -0,0 +1,156 @@
+"""
+Vektorisierte Auswertung der Benchmark-Ergebnisse: Die Scores werden einmalig
+in eine numerische Matrix (Unternehmen × Kriterien) überführt, auf der alle
+Kennzahlen ohne Python-Schleifen über Unternehmen berechnet werden.
+"""
+import numpy as np
+import pandas as pd
+
+# Suffix der Score-Spalten in den Ergebniszeilen
+SCORE_SUFFIX = " | Score"
+
+
+def criterion_column(c: dict) -> str:
+    """Spaltenname eines Kriteriums (wie in den Ergebniszeilen, ohne Suffix)."""
+    return f"{c['category']} - {c['name']}"
+
+
+def score_matrix(results: list, Kriterien: list) -> pd.DataFrame:
+    """
+    Wandelt die Ergebniszeilen in eine float-Matrix Unternehmen × Kriterien um.
+    Fehlende, nicht-numerische oder außerhalb der Skala liegende Scores werden NaN.
+    Bei doppelten Unternehmensnamen gilt die letzte Zeile.
+    """
+    spalten = [criterion_column(c) for c in Kriterien]
+    score_spalten = [s + SCORE_SUFFIX for s in spalten]
+
+    # Eine einzige Umwandlung über alle Zellen statt einer pro Spalte
+    roh = pd.Series([row.get(s) for row in results for s in score_spalten], dtype=object)
+    werte = pd.to_numeric(roh, errors="coerce").to_numpy(dtype=float, copy=True)
+    werte = werte.reshape(len(results), len(spalten))
+    scales = np.array([c["scale"] for c in Kriterien], dtype=float)
+    werte[(werte < 1) | (werte > scales)] = np.nan
+
+    index = pd.Index([row.get("Unternehmen", "") for row in results], name="Unternehmen")
+    matrix = pd.DataFrame(werte, index=index, columns=spalten)
+    return matrix[~matrix.index.duplicated(keep="last")]
+
+
+def normalize_scores(matrix: pd.DataFrame, Kriterien: list) -> pd.DataFrame:
+    """Skaliert alle Scores auf 0..1 (1 → 0, Skalenmaximum → 1), unabhängig von der Skala."""
+    scales = np.array([c["scale"] for c in Kriterien], dtype=float)
+    return (matrix - 1) / np.maximum(scales - 1, 1)
+
+
+def category_scores(normalisiert: pd.DataFrame, Kriterien: list) -> pd.DataFrame:
+    """Mittelwert der normalisierten Scores je Kategorie (Reihenfolge wie in den Kriterien)."""
+    kategorien = [c["category"] for c in Kriterien]
+    aggregiert = normalisiert.T.groupby(np.array(kategorien)).mean().T
+    return aggregiert.reindex(columns=list(dict.fromkeys(kategorien)))
+
+
+def rankings(normalisiert: pd.DataFrame) -> pd.DataFrame:
+    """Gesamtwert, Rang, Perzentil und Abdeckung (Anteil bewerteter Kriterien) je Unternehmen."""
+    gesamt = normalisiert.mean(axis=1)
+    ranking = pd.DataFrame({
+        "Gesamt": gesamt,
+        "Rang": gesamt.rank(ascending=False, method="min"),
+        "Perzentil": gesamt.rank(pct=True) * 100,
+        "Abdeckung": normalisiert.notna().mean(axis=1),
+    })
+    return ranking.sort_values(["Rang", "Abdeckung"], ascending=[True, False])
+
+
+def profile_matrix(normalisiert: pd.DataFrame) -> np.ndarray:
+    """
+    Zentrierte, auf Länge 1 normierte Score-Profile je Unternehmen (Zeilen).
+    Fehlende Werte werden mit dem Kriteriums-Mittel gefüllt und zählen damit neutral.
+    """
+    werte = normalisiert.to_numpy(dtype=float)
+    mittel = normalisiert.mean().fillna(0).to_numpy(dtype=float)
+    zentriert = np.where(np.isnan(werte), mittel, werte) - mittel
+    normen = np.linalg.norm(zentriert, axis=1, keepdims=True)
+    return np.divide(zentriert, normen, out=np.zeros_like(zentriert), where=normen > 0)
+
+
+def similar_peers(analyse: dict, company: str, n: int = 5) -> pd.Series:
+    """Die n Unternehmen mit dem ähnlichsten Score-Profil (Kosinus-Ähnlichkeit)."""
+    index = analyse["normalisiert"].index
+    profile = analyse["profile"]
+    pos = index.get_loc(company)
+    aehnlichkeit = pd.Series(profile @ profile[pos], index=index).drop(company)
+    return aehnlichkeit.nlargest(n)
+
+
+def kmeans(profile: np.ndarray, k: int, iterationen: int = 50, seed: int = 0) -> np.ndarray:
+    """
+    Einfaches, deterministisches k-Means (k-means++-Initialisierung) auf den
+    Score-Profilen. Gibt das Cluster-Label je Unternehmen zurück.
+    """
+    n = len(profile)
+    k = max(1, min(k, n))
+    if n == 0:
+        return np.zeros(0, dtype=int)
+
+    rng = np.random.default_rng(seed)
+    zentren = [profile[rng.integers(n)]]
+    for _ in range(1, k):
+        dist = np.min(((profile[:, None, :] - np.array(zentren)[None]) ** 2).sum(axis=2), axis=1)
+        summe = dist.sum()
+        zentren.append(profile[rng.choice(n, p=dist / summe)] if summe > 0 else profile[rng.integers(n)])
+    zentren = np.array(zentren)
+
+    labels = np.full(n, -1)
+    for _ in range(iterationen):
+        dist = (profile ** 2).sum(axis=1)[:, None] - 2 * profile @ zentren.T + (zentren ** 2).sum(axis=1)[None]
+        neue_labels = dist.argmin(axis=1)
+        if np.array_equal(neue_labels, labels):
+            break
+        labels = neue_labels
+        summen = np.zeros_like(zentren)
+        np.add.at(summen, labels, profile)
+        anzahl = np.bincount(labels, minlength=k)[:, None]
+        zentren = np.where(anzahl > 0, summen / np.maximum(anzahl, 1), zentren)
+    return labels
+
+
+def clusters(analyse: dict, k: int) -> tuple:
+    """Cluster-Zuordnung je Unternehmen und mittleres Kategorien-Profil je Cluster (gecacht je k)."""
+    cache = analyse.setdefault("_clusters", {})
+    if k not in cache:
+        labels = kmeans(analyse["profile"], k)
+        zuordnung = pd.Series(labels + 1, index=analyse["normalisiert"].index, name="Cluster")
+        profil = analyse["kategorien"].groupby(zuordnung).mean()
+        # Kategorien sind frei benannt; die Anzahl-Spalte darf keinen Kategorienamen doppeln
+        anzahl_spalte = "Anzahl" if "Anzahl" not in profil.columns else "Anzahl Unternehmen"
+        profil.insert(0, anzahl_spalte, zuordnung.groupby(zuordnung).size())
+        cache[k] = (zuordnung, profil)
+    return cache[k]
+
+
+def heatmap_data(analyse: dict, top_n: int = 50) -> pd.DataFrame:
+    """Normalisierte Scores der top_n Unternehmen (nach Rang) im Long-Format für eine Heatmap."""
+    top = analyse["ranking"].index[:top_n]
+    return (
+        analyse["normalisiert"].loc[top]
+        .reset_index()
+        .melt(id_vars="Unternehmen", var_name="Kriterium", value_name="Wert")
+    )
+
+
+def build_analytics(results: list, Kriterien: list) -> dict:
+    """
+    Berechnet einmalig alle Kennzahlen für einen Ergebnisstand: Score-Matrix,
+    normalisierte Scores, Kategorien-Mittel, Ranking, Perzentile je Kriterium
+    und Score-Profile für Peer-Vergleich und Clustering.
+    """
+    matrix = score_matrix(results, Kriterien)
+    normalisiert = normalize_scores(matrix, Kriterien)
+    return {
+        "matrix": matrix,
+        "normalisiert": normalisiert,
+        "kategorien": category_scores(normalisiert, Kriterien),
+        "ranking": rankings(normalisiert),
+        "perzentile": normalisiert.rank(pct=True) * 100,
+        "profile": profile_matrix(normalisiert),
+    }
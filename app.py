@@ -1,11 +1,34 @@
-import json
-import re
+from __future__ import annotations
+
 import time
+
+# Startzeit des Skriptlaufs für die Laufzeit-Messung (siehe render_timing)
+_RUN_START = time.perf_counter()
+
+import os
 import uuid
-import pandas as pd
 import streamlit as st
 from io import BytesIO
 from copy import deepcopy
+from typing import TYPE_CHECKING
+
+from research import (
+    ANFRAGE_ABSTAND_SEKUNDEN,
+    BEISPIEL_TOKEN_BUDGET,
+    MAX_BEISPIELE_PRO_KRITERIUM,
+    analyse_company,
+    build_prompt,
+    create_rate_limiter,
+    estimate_tokens,
+    format_example,
+    shard_kriterien,
+)
+from storage import load_json, update_json
+
+# pandas, numpy, openpyxl und google-genai werden erst bei Bedarf importiert,
+# damit der Kaltstart bis zur Überblicksseite ohne diese Pakete auskommt.
+if TYPE_CHECKING:
+    import pandas as pd
 
 # ─────────────────────────────────────────────
 # PAGE CONFIG
@@ -150,68 +173,75 @@ DEFAULT_Unternehmen = "\n".join([
     "Commerzbank", "ING Deutschland",
 ])
 
-DEFAULT_Kriterien = [
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Geschäftsmodell",
-        "name": "Wertschöpfungstiefe",
-        "description": "Bewerte, in welchem Umfang die Wertschöpfung intern erfolgt vs. über Drittpartner.",
-        "scale": 4,
-        "anchor_low":  "Plattform-Fokus (hohe Fremdfertigung) → >80 % der Wertschöpfung über Drittanbieter",
-        "anchor_high": "Eigenfertigungs-Fokus (volle Integration) → 0–10 % Fremdabwicklung, überwiegend eigene Bilanz/Infrastruktur",
-        "examples": [],
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Geschäftsmodell",
-        "name": "Erlösbasis",
-        "description": "Bewerte Struktur und Diversifikation der Ertragsquellen.",
-        "scale": 4,
-        "anchor_low":  "Klassisch → primär Zinsen, Provisionen, transaktionsbasierte Gebühren",
-        "anchor_high": "Alternativ/erweitert → signifikante Erlöse aus Services, Abonnements, Plattform- oder SaaS-Modellen",
-        "examples": [],
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Markt- und Kundenzugang",
-        "name": "Zielgruppen-Fokus",
-        "description": "Bewerte die strategische Breite des Angebots.",
-        "scale": 4,
-        "anchor_low":  "Starke Segment-Spezialisierung → klar definierte Zielgruppe oder Use Cases",
-        "anchor_high": "Vollumfängliches Finanzportfolio → breites Angebot für mehrere Zielgruppen/Lebenssituationen",
-        "examples": [],
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Markt- und Kundenzugang",
-        "name": "Beziehungs-Hoheit",
-        "description": "Bewerte die Rolle im direkten Kundenkontakt.",
-        "scale": 4,
-        "anchor_low":  "Abwicklung ohne Kundenschnittstelle → B2B-/White-Label-Rolle, kaum direkte Kundeninteraktion",
-        "anchor_high": "Zentrale und erste Schnittstelle für jeglichen Finanzbedarf → täglicher Touchpoint, hohe Nutzungstiefe",
-        "examples": [],
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Operating Model",
-        "name": "Innovations-Modus",
-        "description": "Bewerte Organisations- und Entwicklungslogik.",
-        "scale": 4,
-        "anchor_low":  "Starr & manuell → Silo-Strukturen, lange Entscheidungswege, hoher manueller Anteil",
-        "anchor_high": "Agil & produktgetrieben → cross-funktionale Teams, schnelle Iterationen, hohe Automatisierung",
-        "examples": [],
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "category": "Operating Model",
-        "name": "Daten- & Technologie-Fundament",
-        "description": "Bewerte den Reifegrad von Technologie, Daten & Analytics.",
-        "scale": 4,
-        "anchor_low":  "Wenig weit entwickelt → geringe Datenintegration, limitierte Analytics/AI-Nutzung",
-        "anchor_high": "Hoch entwickelt → moderne API-Architektur, starke Analytics, systematischer AI-Einsatz",
-        "examples": [],
-    },
-]
+
+@st.cache_resource
+def load_default_kriterien() -> list:
+    """Standard-Kriterien, einmal pro Prozess erzeugt (stabile IDs über Reruns hinweg)."""
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Geschäftsmodell",
+            "name": "Wertschöpfungstiefe",
+            "description": "Bewerte, in welchem Umfang die Wertschöpfung intern erfolgt vs. über Drittpartner.",
+            "scale": 4,
+            "anchor_low":  "Plattform-Fokus (hohe Fremdfertigung) → >80 % der Wertschöpfung über Drittanbieter",
+            "anchor_high": "Eigenfertigungs-Fokus (volle Integration) → 0–10 % Fremdabwicklung, überwiegend eigene Bilanz/Infrastruktur",
+            "examples": [],
+        },
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Geschäftsmodell",
+            "name": "Erlösbasis",
+            "description": "Bewerte Struktur und Diversifikation der Ertragsquellen.",
+            "scale": 4,
+            "anchor_low":  "Klassisch → primär Zinsen, Provisionen, transaktionsbasierte Gebühren",
+            "anchor_high": "Alternativ/erweitert → signifikante Erlöse aus Services, Abonnements, Plattform- oder SaaS-Modellen",
+            "examples": [],
+        },
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Markt- und Kundenzugang",
+            "name": "Zielgruppen-Fokus",
+            "description": "Bewerte die strategische Breite des Angebots.",
+            "scale": 4,
+            "anchor_low":  "Starke Segment-Spezialisierung → klar definierte Zielgruppe oder Use Cases",
+            "anchor_high": "Vollumfängliches Finanzportfolio → breites Angebot für mehrere Zielgruppen/Lebenssituationen",
+            "examples": [],
+        },
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Markt- und Kundenzugang",
+            "name": "Beziehungs-Hoheit",
+            "description": "Bewerte die Rolle im direkten Kundenkontakt.",
+            "scale": 4,
+            "anchor_low":  "Abwicklung ohne Kundenschnittstelle → B2B-/White-Label-Rolle, kaum direkte Kundeninteraktion",
+            "anchor_high": "Zentrale und erste Schnittstelle für jeglichen Finanzbedarf → täglicher Touchpoint, hohe Nutzungstiefe",
+            "examples": [],
+        },
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Operating Model",
+            "name": "Innovations-Modus",
+            "description": "Bewerte Organisations- und Entwicklungslogik.",
+            "scale": 4,
+            "anchor_low":  "Starr & manuell → Silo-Strukturen, lange Entscheidungswege, hoher manueller Anteil",
+            "anchor_high": "Agil & produktgetrieben → cross-funktionale Teams, schnelle Iterationen, hohe Automatisierung",
+            "examples": [],
+        },
+        {
+            "id": str(uuid.uuid4()),
+            "category": "Operating Model",
+            "name": "Daten- & Technologie-Fundament",
+            "description": "Bewerte den Reifegrad von Technologie, Daten & Analytics.",
+            "scale": 4,
+            "anchor_low":  "Wenig weit entwickelt → geringe Datenintegration, limitierte Analytics/AI-Nutzung",
+            "anchor_high": "Hoch entwickelt → moderne API-Architektur, starke Analytics, systematischer AI-Einsatz",
+            "examples": [],
+        },
+    ]
+
+
+DEFAULT_Kriterien = load_default_kriterien()
 
 # ─────────────────────────────────────────────
 # SESSION STATE INIT
@@ -226,6 +256,28 @@ if "adding_criterion" not in st.session_state:
     st.session_state.adding_criterion = False
 if "editing_id" not in st.session_state:
     st.session_state.editing_id = None
+if "shard_nach_kategorie" not in st.session_state:
+    st.session_state.shard_nach_kategorie = False
+if "shard_max" not in st.session_state:
+    st.session_state.shard_max = 0
+if "prioritaet" not in st.session_state:
+    st.session_state.prioritaet = []
+if "zeitlimit_min" not in st.session_state:
+    st.session_state.zeitlimit_min = 0
+if "token_budget" not in st.session_state:
+    st.session_state.token_budget = 0
+if "run_active" not in st.session_state:
+    st.session_state.run_active = False
+if "run_hinweis" not in st.session_state:
+    st.session_state.run_hinweis = None
+if "sources" not in st.session_state:
+    st.session_state.sources = []
+if "sources_resolved" not in st.session_state:
+    st.session_state.sources_resolved = False
+if "results_version" not in st.session_state:
+    st.session_state.results_version = 0
+if "laufzeiten" not in st.session_state:
+    st.session_state.laufzeiten = {"letzte_ms": None}
 
 # Navigation State
 if "page_index" not in st.session_state:
@@ -267,155 +319,117 @@ with st.sidebar:
         # Fallback if the rest of your app logic hasn't loaded yet
         st.info("Initialisiere Tool...")
 
+    # Platzhalter für die Laufzeit-Messung, befüllt am Ende jedes Skriptlaufs
+    timing_placeholder = st.empty()
+
 # ═══════════════════════════════════════════════════════
 # HILFSFUNKTIONEN (RESEARCH & ANALYSE)
 # ═══════════════════════════════════════════════════════
 
-def build_prompt(company_name: str, Kriterien: list) -> str:
-    """Erstellt den Analyse-Prompt basierend auf den konfigurierten Kriterien."""
-
-    Kriterien_block = ""
-    for i, c in enumerate(Kriterien, 1):
-        Kriterien_block += f"""
-{i}. {c['category'].upper()} – {c['name']}
-
-{c['description']}
-
-Skalenanker:
-1 = {c['anchor_low']}
-{c['scale']} = {c['anchor_high']}
-"""
-        if c.get("examples"):
-            Kriterien_block += "\nKalibrierungsbeispiele:\n"
-            for ex in c["examples"]:
-                Kriterien_block += f"  - {ex['company']}: Score {ex['score']} — {ex['reason']}\n"
-        Kriterien_block += "\n---\n"
-
-    json_example_items = ""
-    for c in Kriterien:
-        json_example_items += f"""    {{
-      "kategorie": "{c['category']}",
-      "kriterium": "{c['name']}",
-      "score": "1-{c['scale']}",
-      "begruendung": "..."
-    }},
-"""
-
-    json_example_items_clean = json_example_items.rstrip(",\n")
-
-    prompt = f"""<rolle>
-Du bist ein unabhängiger, erfahrener Finanz- und Strategieberater.
-Du arbeitest faktenbasiert, kritisch, vergleichend und nachvollziehbar.
-</rolle>
-
-<kontext>
-Du bewertest Finanz- und FinTech-Unternehmen anhand öffentlich zugänglicher Informationen für das Jahr 2025.
-</kontext>
-
-<aufgabe>
-Analysiere und bewerte das folgende Unternehmen: {company_name}
-
-Führe eine gezielte Web-Recherche durch. Nutze ausschließlich überprüfbare Quellen.
-Wichtig: Schreibe die Begründungen in klaren, faktischen Sätzen. Vermeide vage Formulierungen, damit die Quellen eindeutig zugeordnet werden können.
-</aufgabe>
-
-<bewertungssystem>
-Nutze die definierte Skala pro Kriterium. Bewerte relativ zum Marktumfeld.
-</bewertungssystem>
-
-<kriterien>
-{Kriterien_block}
-</kriterien>
-
-<ausgabeformat>
-Gib die Antwort AUSSCHLIESSLICH als valides JSON zurück.
-
-{{
-  "unternehmen": "{company_name}",
-  "bewertungen": [
-{json_example_items_clean}
-  ],
-  "hinweise_zur_datenlage": "Hinweise zu Datenlücken oder Vergleichbarkeit."
-}}
-</ausgabeformat>
-"""
-    return prompt
-
-
-def extract_json(text: str):
-    """Extrahiert JSON-Inhalte aus dem KI-Antworttext."""
-    try:
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            return json.loads(match.group())
-    except Exception:
-        pass
-    return None
+# Schätzwert pro Unternehmen, solange noch keine Laufzeiten protokolliert wurden
+SEKUNDEN_PRO_UNTERNEHMEN_STANDARD = 8
+# Protokollierte Anfragen früherer Läufe (Latenz, Tokens) für die ETA-Schätzung
+RUN_STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".run_stats.json")
+# Anzahl der zuletzt protokollierten Anfragen, die in die Schätzung eingehen
+RUN_STATS_FENSTER = 200
+
+
 
+def load_run_stats() -> list:
+    """Lädt die protokollierten Anfragen früherer Läufe (nur gültige Einträge)."""
+    return [e for e in load_json(RUN_STATS_PATH, []) if isinstance(e, dict)]
 
-def get_granular_sources(text_to_check: str, metadata) -> list:
+
+def save_run_stats(neue: list):
     """
-    Identifiziert spezifische URLs aus den Grounding-Metadaten, 
-    die direkt mit dem übergebenen Textsegment verknüpft sind.
+    Hängt neu protokollierte Anfragen an das gespeicherte Protokoll an
+    (begrenzt auf die letzten RUN_STATS_FENSTER). Einträge paralleler
+    Sessions bleiben erhalten.
     """
-    if not metadata or not hasattr(metadata, 'grounding_supports'):
-        return []
-
-    found_urls = []
-    for support in metadata.grounding_supports:
-        support_text = support.segment.text
-        # Prüfung auf Überschneidung zwischen Begründungstext und Quell-Segment
-        if support_text in text_to_check or text_to_check in support_text:
-            for index in support.grounding_chunk_indices:
-                if index < len(metadata.grounding_chunks):
-                    chunk = metadata.grounding_chunks[index]
-                    if chunk.web:
-                        found_urls.append(chunk.web.uri)
-    
-    return sorted(list(set(found_urls)))
+    if neue:
+        update_json(RUN_STATS_PATH, [], lambda eintraege: (eintraege + neue)[-RUN_STATS_FENSTER:])
+
 
+def fit_linear(xs: list, ys: list):
+    """
+    Passt y = a + b * x per kleinster Quadrate an.
+    Bei nur einem x-Wert oder negativen Koeffizienten wird proportional geschätzt.
+    """
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    if sxx > 0:
+        b = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+        a = my - b * mx
+        if a >= 0 and b >= 0:
+            return a, b
+    return 0.0, (my / mx if mx else 0.0)
+
+
+def estimate_company(verlauf: list, shards: list):
+    """
+    Schätzt Dauer (Sekunden) und Token-Verbrauch für ein Unternehmen anhand
+    protokollierter Anfragen. Parallele Shards zählen bei der Dauer mit dem
+    größten Shard, starten aber wegen des Rate-Limits im Mindestabstand.
+    Ohne Protokoll: Standardwert und unbekannte Tokens (None).
+    """
+    eintraege = [
+        e for e in verlauf[-RUN_STATS_FENSTER:]
+        if isinstance(e.get("kriterien"), int) and e["kriterien"] > 0
+        and isinstance(e.get("sekunden"), (int, float))
+    ]
+    if not eintraege:
+        return SEKUNDEN_PRO_UNTERNEHMEN_STANDARD, None
 
-def parse_response(data: dict, company: str, Kriterien: list, metadata=None) -> dict:
-    """Wandelt die JSON-Antwort und Metadaten in ein flaches Dictionary für den Export um."""
-    row = {"Unternehmen": company, "Status": "OK"}
-    bewertungen = data.get("bewertungen", [])
+    xs = [e["kriterien"] for e in eintraege]
+    a_sek, b_sek = fit_linear(xs, [e["sekunden"] for e in eintraege])
+    laengste = max(a_sek + b_sek * len(shard) for shard in shards)
+    sekunden = max((len(shards) - 1) * ANFRAGE_ABSTAND_SEKUNDEN + laengste,
+                   len(shards) * ANFRAGE_ABSTAND_SEKUNDEN)
 
-    lookup = {}
-    for b in bewertungen:
-        key = (b.get("kategorie", "").strip(), b.get("kriterium", "").strip())
-        lookup[key] = b
+    mit_tokens = [e for e in eintraege if isinstance(e.get("tokens"), (int, float)) and e["tokens"] > 0]
+    if not mit_tokens:
+        return sekunden, None
+    a_tok, b_tok = fit_linear([e["kriterien"] for e in mit_tokens], [e["tokens"] for e in mit_tokens])
+    tokens = round(sum(a_tok + b_tok * len(shard) for shard in shards))
+    return sekunden, tokens
+
+
+def order_by_priority(Unternehmen: list, priorisiert: list) -> list:
+    """Sortiert priorisierte Unternehmen (in ihrer Reihenfolge) vor alle übrigen."""
+    vorne = [u for u in priorisiert if u in Unternehmen]
+    return vorne + [u for u in Unternehmen if u not in vorne]
 
-    for c in Kriterien:
-        col_base = f"{c['category']} - {c['name']}"
-        b = lookup.get((c["category"], c["name"]), {})
-        
-        begruendung = b.get("begruendung", "")
-        # Granulares Mapping der Quellen pro Kriterium
-        quellen_liste = get_granular_sources(begruendung, metadata)
-        
-        row[f"{col_base} | Score"] = b.get("score", "")
-        row[f"{col_base} | Begründung"] = begruendung
-        row[f"{col_base} | Quellen"] = "\n".join(quellen_liste)
 
-    row["Hinweise Datenlage"] = data.get("hinweise_zur_datenlage", "")
-    return row
 
 
 def results_to_df(results: list, Kriterien: list) -> pd.DataFrame:
     """Konvertiert die Ergebnisliste in ein Pandas DataFrame."""
+    import pandas as pd
+
     return pd.DataFrame(results)
 
 
-def to_excel(df: pd.DataFrame) -> bytes:
-    """Erzeugt einen Excel-Datenstrom aus dem DataFrame."""
+def to_excel(df: pd.DataFrame, quellen_df: pd.DataFrame = None) -> bytes:
+    """Erzeugt einen Excel-Datenstrom aus dem DataFrame (optional mit Quellentabelle)."""
+    import pandas as pd
+
     buf = BytesIO()
     with pd.ExcelWriter(buf, engine="openpyxl") as writer:
         df.to_excel(writer, index=False, sheet_name="Benchmark")
+        if quellen_df is not None and not quellen_df.empty:
+            quellen_df.to_excel(writer, index=False, sheet_name="Quellen")
     return buf.getvalue()
 
 
-def run_analysis(api_key: str, Unternehmen: list, Kriterien: list):
-    """Führt die vollständige Benchmark-Analyse mit Fortschrittsanzeige aus."""
+def run_analysis(api_key: str, Unternehmen: list, Kriterien: list, shards: list = None,
+                 zeitlimit_min: int = 0, token_budget: int = 0):
+    """
+    Führt die Benchmark-Analyse mit Fortschrittsanzeige aus.
+    Bricht vor dem nächsten Unternehmen ab, wenn dessen geschätzte Dauer das
+    Zeitlimit oder dessen geschätzte Tokens das Budget überschreiten würden.
+    Abgeschlossene Zeilen werden laufend gespeichert und bleiben bei Abbruch erhalten.
+    """
     try:
         from google import genai as genai_client
         from google.genai import types
@@ -427,7 +441,23 @@ def run_analysis(api_key: str, Unternehmen: list, Kriterien: list):
     grounding_tool = types.Tool(google_search=types.GoogleSearch())
     config = types.GenerateContentConfig(tools=[grounding_tool])
 
-    results = []
+    shards = shards or [Kriterien]
+    verlauf = load_run_stats()
+    protokoll = []
+    gespeichert = 0
+    limiter = create_rate_limiter()
+    deadline = time.time() + zeitlimit_min * 60 if zeitlimit_min else None
+
+    # Ergebnisse direkt im Session State, damit sie einen Abbruch überstehen
+    st.session_state.results = []
+    st.session_state.results_version += 1
+    st.session_state.sources = []
+    st.session_state.sources_resolved = False
+    st.session_state.run_active = True
+    st.session_state.run_hinweis = None
+    results = st.session_state.results
+
+    st.button("Analyse abbrechen", key="cancel_run")  # Klick unterbricht den laufenden Skriptlauf
     progress_bar = st.progress(0)
     status_text = st.empty()
     log_area = st.empty()
@@ -435,41 +465,177 @@ def run_analysis(api_key: str, Unternehmen: list, Kriterien: list):
 
     for idx, company in enumerate(Unternehmen):
         pct = (idx + 1) / len(Unternehmen)
-        status_text.markdown(f"**Verarbeite {idx+1} von {len(Unternehmen)}: {company}**")
+        sekunden, tokens = estimate_company(verlauf + protokoll, shards)
+        verbraucht = sum(e["tokens"] for e in protokoll)
+        offen = len(Unternehmen) - idx
+
+        if deadline and time.time() + sekunden > deadline:
+            st.session_state.run_hinweis = f"Zeitlimit erreicht – {offen} Unternehmen nicht bearbeitet."
+            break
+        if token_budget and verbraucht + (tokens or 0) > token_budget:
+            st.session_state.run_hinweis = f"Token-Budget erreicht – {offen} Unternehmen nicht bearbeitet."
+            break
+
+        rest_min = max(1, round(offen * sekunden / 60))
+        status_text.markdown(
+            f"**Verarbeite {idx+1} von {len(Unternehmen)}: {company}** "
+            f"(Restdauer ca. {rest_min} Min., {verbraucht:,} Tokens verbraucht)"
+        )
 
         try:
-            prompt = build_prompt(company, Kriterien)
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt,
-                config=config,
-            )
-
-            metadata = response.candidates[0].grounding_metadata
-            data = extract_json(response.text)
-
-            if data and "bewertungen" in data:
-                # Übergabe der Metadaten für das präzise Source-Mapping
-                row = parse_response(data, company, Kriterien, metadata)
-                results.append(row)
-                log_lines.append(f"Erfolg: {company}")
-            else:
-                results.append({"Unternehmen": company, "Status": "Fehler beim Auslesen der Daten"})
-                log_lines.append(f"Fehler: {company} (JSON konnte nicht gelesen werden)")
+            row, log_line = analyse_company(client, config, company, Kriterien, shards, protokoll, limiter)
+            results.append(row)
+            log_lines.append(log_line)
 
         except Exception as e:
             results.append({"Unternehmen": company, "Status": f"Systemfehler: {str(e)}"})
             log_lines.append(f"Fehler: {company} ({str(e)})")
 
+        save_run_stats(protokoll[gespeichert:])
+        gespeichert = len(protokoll)
         log_area.code("\n".join(log_lines[-10:]))
         progress_bar.progress(pct)
-        time.sleep(2) # Kurze Pause zur Stabilisierung
 
     status_text.markdown("**Analyse vollständig abgeschlossen**")
-    st.session_state.results = results
+    st.session_state.run_active = False
     st.rerun()
 
 
+def results_key(results: list, Kriterien: list) -> tuple:
+    """Schlüssel des aktuellen Ergebnisstands für die Caches im Session State."""
+    return (
+        st.session_state.results_version,
+        len(results),
+        tuple((c["id"], c["category"], c["name"], c["scale"]) for c in Kriterien),
+    )
+
+
+def get_exports(results: list, sources: list, Kriterien: list) -> dict:
+    """
+    Erzeugt Ergebnis- und Quellentabelle sowie CSV-/Excel-Dateien einmal pro
+    Ergebnisstand, statt bei jeder Interaktion neu.
+    """
+    import pandas as pd
+
+    key = results_key(results, Kriterien)
+    cached = st.session_state.get("exports_cache")
+    if cached is None or cached[0] != key:
+        df = results_to_df(results, Kriterien)
+        quellen_df = pd.DataFrame(sources, columns=["ID", "URL"])
+        cached = (key, {
+            "df": df,
+            "quellen_df": quellen_df,
+            "csv": df.to_csv(index=False).encode("utf-8"),
+            "quellen_csv": quellen_df.to_csv(index=False).encode("utf-8"),
+            "excel": to_excel(df, quellen_df),
+        })
+        st.session_state.exports_cache = cached
+    return cached[1]
+
+
+def get_analytics(results: list, Kriterien: list) -> dict:
+    """Liefert die Auswertung des aktuellen Ergebnisstands (einmal pro Version berechnet)."""
+    from analytics import build_analytics
+
+    key = results_key(results, Kriterien)
+    cached = st.session_state.get("analytics_cache")
+    if cached is None or cached[0] != key:
+        cached = (key, build_analytics(results, Kriterien))
+        st.session_state.analytics_cache = cached
+    return cached[1]
+
+
+def render_analytics(results: list, Kriterien: list):
+    """Zeigt Ranking, Kategorien, Heatmap und Peer-Vergleich über alle Unternehmen."""
+    import altair as alt
+    from analytics import clusters, heatmap_data, similar_peers
+
+    analyse = get_analytics(results, Kriterien)
+    if analyse["ranking"]["Gesamt"].isna().all():
+        st.info("Noch keine gültigen Scores für eine Auswertung vorhanden.")
+        return
+
+    prozent = st.column_config.ProgressColumn(min_value=0, max_value=1, format="%.2f")
+    tab_rank, tab_kat, tab_heat, tab_peer = st.tabs(["Ranking", "Kategorien", "Heatmap", "Peer-Vergleich"])
+
+    with tab_rank:
+        ranking = analyse["ranking"].join(analyse["kategorien"])
+        # Abdeckung als Prozentwert anzeigen (printf-Format, kompatibel mit älteren Streamlit-Versionen)
+        ranking["Abdeckung"] = ranking["Abdeckung"] * 100
+        st.dataframe(
+            ranking,
+            use_container_width=True,
+            height=400,
+            column_config={
+                "Gesamt": prozent,
+                "Rang": st.column_config.NumberColumn(format="%d"),
+                "Perzentil": st.column_config.NumberColumn(format="%.0f"),
+                "Abdeckung": st.column_config.NumberColumn(format="%.0f %%"),
+            },
+        )
+
+    with tab_kat:
+        st.caption("Normalisierte Scores (0 = niedrigster, 1 = höchster Skalenwert), gemittelt über alle Unternehmen.")
+        st.bar_chart(analyse["kategorien"].mean())
+        st.dataframe(
+            analyse["perzentile"].loc[analyse["ranking"].index],
+            use_container_width=True,
+            height=400,
+            column_config={c: st.column_config.NumberColumn(format="%.0f") for c in analyse["perzentile"].columns},
+        )
+
+    with tab_heat:
+        top_n = n_unternehmen = len(analyse["ranking"])
+        if n_unternehmen > 5:
+            top_n = st.slider("Anzahl Unternehmen (nach Rang)", 5, min(200, n_unternehmen), min(50, n_unternehmen))
+        chart = alt.Chart(heatmap_data(analyse, top_n)).mark_rect().encode(
+            x=alt.X("Kriterium:N", sort=None, axis=alt.Axis(labelAngle=-45)),
+            y=alt.Y("Unternehmen:N", sort=None),
+            color=alt.Color("Wert:Q", scale=alt.Scale(domain=[0, 1], scheme="blues")),
+            tooltip=["Unternehmen", "Kriterium", alt.Tooltip("Wert:Q", format=".2f")],
+        )
+        st.altair_chart(chart, use_container_width=True)
+
+    with tab_peer:
+        peer_col, cluster_col = st.columns(2)
+        with peer_col:
+            company = st.selectbox("Unternehmen", list(analyse["ranking"].index))
+            peers = similar_peers(analyse, company).rename("Ähnlichkeit").to_frame()
+            st.dataframe(peers, use_container_width=True,
+                         column_config={"Ähnlichkeit": st.column_config.NumberColumn(format="%.2f")})
+        with cluster_col:
+            k = st.number_input("Anzahl Cluster", min_value=2, max_value=10, value=3, step=1)
+            zuordnung, profil = clusters(analyse, int(k))
+            st.dataframe(profil, use_container_width=True)
+            st.dataframe(zuordnung.sort_values(), use_container_width=True, height=250)
+
+
+@st.cache_resource
+def process_timings() -> dict:
+    """Prozessweite Messwerte; der erste Skriptlauf eines Prozesses ist der Kaltstart."""
+    return {"kaltstart_ms": None}
+
+
+def render_timing(placeholder, timings: dict, laufzeiten: dict):
+    """
+    Misst die Laufzeit des aktuellen Skriptlaufs und zeigt sie mit dem Kaltstart
+    und dem vorherigen Lauf (z. B. vor einem st.rerun) im Sidebar-Platzhalter.
+    timings und laufzeiten werden vor dem Seitenaufbau geholt: Nach st.stop()
+    oder st.rerun() löst jeder Zugriff auf st.session_state bzw. jedes Element
+    erneut den Abbruch aus, die Messung wird daher zuerst in den Dicts abgelegt.
+    """
+    laufzeit_ms = (time.perf_counter() - _RUN_START) * 1000
+    if timings["kaltstart_ms"] is None:
+        timings["kaltstart_ms"] = laufzeit_ms
+    vorheriger_ms = laufzeiten["letzte_ms"]
+    laufzeiten["letzte_ms"] = laufzeit_ms
+
+    text = f"Kaltstart: {timings['kaltstart_ms']:.0f} ms · Letzte Interaktion: {laufzeit_ms:.0f} ms"
+    if vorheriger_ms is not None:
+        text += f" (vorheriger Lauf: {vorheriger_ms:.0f} ms)"
+    placeholder.caption(text)
+
+
 def render_navigation_bottom():
     """Zeigt Navigations-Buttons am Ende der Seite an."""
     st.markdown("---")
@@ -487,316 +653,414 @@ def render_navigation_bottom():
                 st.session_state.page_index += 1
                 st.rerun()
 
-# ═══════════════════════════════════════════════════════
-# PAGE 0 – ÜBERBLICK
-# ═══════════════════════════════════════════════════════
-page = PAGES[st.session_state.page_index]
-
-if page == "Überblick":
-    st.markdown("## Willkommen zum automatisierten Gemini Research Tool")
-
-    st.markdown("""
-    Diese Anwendung ermöglicht:
-
-    1. Definition von Unternehmen
-    2. Konfiguration individueller Bewertungskriterien
-    3. Kalibrierung mittels Referenzbeispielen
-    4. KI-gestützte Analyse mit Web-Recherche
-    5. Export der Ergebnisse als CSV oder Excel
-
-    Vorgehen:
-
-    - Schritt 1: Unternehmen definieren
-    - Schritt 2: Kriterien prüfen oder anpassen
-    - Schritt 3: Optional Kalibrierungsbeispiele hinzufügen
-    - Schritt 4: Analyse starten
-    """)
-
-    if st.button("Starten", use_container_width=True, type="primary"):
-        st.session_state.page_index = 1
-        st.rerun()
-
-# ═══════════════════════════════════════════════════════
-# PAGE 1 – UNTERNEHMEN
-# ═══════════════════════════════════════════════════════
-elif page == "Unternehmen":
-    st.markdown('<div class="step-header">Unternehmen definieren</div>', unsafe_allow_html=True)
-    st.markdown('<div class="step-sub">Ein Unternehmensname pro Zeile. Das Tool recherchiert jedes nacheinander.</div>', unsafe_allow_html=True)
-
-    col_left, col_right = st.columns([2, 1])
-    with col_left:
-        raw = st.text_area(
-            "Unternehmen",
-            value=st.session_state.Unternehmen_text,
-            height=420,
-            label_visibility="collapsed",
-            placeholder="N26\nKlarna\nRevolut\n...",
-        )
-        st.session_state.Unternehmen_text = raw
-
-    with col_right:
-        Unternehmen = [c.strip() for c in raw.splitlines() if c.strip()]
-        st.markdown(f"**{len(Unternehmen)} Unternehmen geladen**")
-        st.markdown("---")
-        for c in Unternehmen[:20]:
-            st.markdown(f"• {c}")
-        if len(Unternehmen) > 20:
-            st.markdown(f"*...und {len(Unternehmen)-20} weitere*")
-        st.markdown("---")
-        if st.button("Auf Standard zurücksetzen"):
-            st.session_state.Unternehmen_text = DEFAULT_Unternehmen
+# Vor dem Seitenaufbau holen, damit render_timing auch nach st.stop()/st.rerun() schreiben kann
+timings = process_timings()
+laufzeiten = st.session_state.laufzeiten
+try:
+    # ═══════════════════════════════════════════════════════
+    # PAGE 0 – ÜBERBLICK
+    # ═══════════════════════════════════════════════════════
+    page = PAGES[st.session_state.page_index]
+
+    if page == "Überblick":
+        st.markdown("## Willkommen zum automatisierten Gemini Research Tool")
+
+        st.markdown("""
+        Diese Anwendung ermöglicht:
+
+        1. Definition von Unternehmen
+        2. Konfiguration individueller Bewertungskriterien
+        3. Kalibrierung mittels Referenzbeispielen
+        4. KI-gestützte Analyse mit Web-Recherche
+        5. Export der Ergebnisse als CSV oder Excel
+
+        Vorgehen:
+
+        - Schritt 1: Unternehmen definieren
+        - Schritt 2: Kriterien prüfen oder anpassen
+        - Schritt 3: Optional Kalibrierungsbeispiele hinzufügen
+        - Schritt 4: Analyse starten
+        """)
+
+        if st.button("Starten", use_container_width=True, type="primary"):
+            st.session_state.page_index = 1
             st.rerun()
 
-    render_navigation_bottom()
+    # ═══════════════════════════════════════════════════════
+    # PAGE 1 – UNTERNEHMEN
+    # ═══════════════════════════════════════════════════════
+    elif page == "Unternehmen":
+        st.markdown('<div class="step-header">Unternehmen definieren</div>', unsafe_allow_html=True)
+        st.markdown('<div class="step-sub">Ein Unternehmensname pro Zeile. Das Tool recherchiert jedes nacheinander.</div>', unsafe_allow_html=True)
+
+        col_left, col_right = st.columns([2, 1])
+        with col_left:
+            raw = st.text_area(
+                "Unternehmen",
+                value=st.session_state.Unternehmen_text,
+                height=420,
+                label_visibility="collapsed",
+                placeholder="N26\nKlarna\nRevolut\n...",
+            )
+            st.session_state.Unternehmen_text = raw
 
-# ═══════════════════════════════════════════════════════
-# PAGE 2 – KRITERIEN
-# ═══════════════════════════════════════════════════════
-elif page == "Kriterien":
-    st.markdown('<div class="step-header">Bewertungskriterien definieren</div>', unsafe_allow_html=True)
-    st.markdown('<div class="step-sub">Definiere, was bewertet wird und wie. Jedes Kriterium verwendet eine Likert-Skala von 1 (niedrig) bis N (hoch).</div>', unsafe_allow_html=True)
-
-    to_delete = None
-
-    for idx, crit in enumerate(st.session_state.Kriterien):
-        # Zeige das Kriterium Card
-        with st.container():
-            st.markdown(f"""
-            <div class="criterion-card">
-                <div style="display: flex; gap: 0.5rem; margin-bottom: 0.5rem;">
-                    <span class="tag">{crit['category']}</span>
-                    <span class="tag">Skala: 1–{crit['scale']}</span>
-                </div>
-                <div class="criterion-title">{crit['name']}</div>
-                <div class="criterion-description">{crit['description']}</div>
-                <div class="criterion-anchors">
-                    <div class="anchor-box">
-                        <strong>Wert 1 (niedrig)</strong><br/>
-                        {crit['anchor_low']}
+        with col_right:
+            Unternehmen = [c.strip() for c in raw.splitlines() if c.strip()]
+            st.markdown(f"**{len(Unternehmen)} Unternehmen geladen**")
+            st.markdown("---")
+            for c in Unternehmen[:20]:
+                st.markdown(f"• {c}")
+            if len(Unternehmen) > 20:
+                st.markdown(f"*...und {len(Unternehmen)-20} weitere*")
+            st.markdown("---")
+            if st.button("Auf Standard zurücksetzen"):
+                st.session_state.Unternehmen_text = DEFAULT_Unternehmen
+                st.rerun()
+
+        render_navigation_bottom()
+
+    # ═══════════════════════════════════════════════════════
+    # PAGE 2 – KRITERIEN
+    # ═══════════════════════════════════════════════════════
+    elif page == "Kriterien":
+        st.markdown('<div class="step-header">Bewertungskriterien definieren</div>', unsafe_allow_html=True)
+        st.markdown('<div class="step-sub">Definiere, was bewertet wird und wie. Jedes Kriterium verwendet eine Likert-Skala von 1 (niedrig) bis N (hoch).</div>', unsafe_allow_html=True)
+
+        to_delete = None
+
+        for idx, crit in enumerate(st.session_state.Kriterien):
+            # Zeige das Kriterium Card
+            with st.container():
+                st.markdown(f"""
+                <div class="criterion-card">
+                    <div style="display: flex; gap: 0.5rem; margin-bottom: 0.5rem;">
+                        <span class="tag">{crit['category']}</span>
+                        <span class="tag">Skala: 1–{crit['scale']}</span>
                     </div>
-                    <div class="anchor-box">
-                        <strong>Wert {crit['scale']} (hoch)</strong><br/>
-                        {crit['anchor_high']}
+                    <div class="criterion-title">{crit['name']}</div>
+                    <div class="criterion-description">{crit['description']}</div>
+                    <div class="criterion-anchors">
+                        <div class="anchor-box">
+                            <strong>Wert 1 (niedrig)</strong><br/>
+                            {crit['anchor_low']}
+                        </div>
+                        <div class="anchor-box">
+                            <strong>Wert {crit['scale']} (hoch)</strong><br/>
+                            {crit['anchor_high']}
+                        </div>
                     </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
 
-            btn_col1, btn_col2, btn_col3, _ = st.columns([1, 1, 1, 5])
-            with btn_col1:
-                if st.button("Bearbeiten", key=f"edit_{crit['id']}", use_container_width=True):
-                    st.session_state.editing_id = crit["id"]
+                btn_col1, btn_col2, btn_col3, _ = st.columns([1, 1, 1, 5])
+                with btn_col1:
+                    if st.button("Bearbeiten", key=f"edit_{crit['id']}", use_container_width=True):
+                        st.session_state.editing_id = crit["id"]
+                        st.rerun()
+                with btn_col2:
+                    if st.button("Löschen", key=f"del_{crit['id']}", use_container_width=True):
+                        to_delete = crit["id"]
+                with btn_col3:
+                    n_ex = len(crit.get("examples", []))
+                    ex_text = "Beispiel" if n_ex == 1 else "Beispiele"
+                    st.markdown(f"<span style='font-size:0.8rem;color:#888'>{n_ex} {ex_text}</span>", unsafe_allow_html=True)
+
+            # Zeige Edit-Form direkt darunter, wenn dieses Kriterium bearbeitet wird
+            if st.session_state.editing_id == crit["id"]:
+                st.markdown('<div class="edit-form-container">', unsafe_allow_html=True)
+                st.subheader("Kriterium bearbeiten")
+
+                with st.form(f"criterion_form_{crit['id']}"):
+                    f_category = st.text_input("Kategorie", value=crit.get("category", ""))
+                    f_name     = st.text_input("Kriterium-Name", value=crit.get("name", ""))
+                    f_desc     = st.text_area("Beschreibung (wird dem Modell angezeigt)",
+                                              value=crit.get("description", ""), height=90)
+                    f_scale    = st.selectbox("Skala", [3, 4, 5],
+                                              index=[3,4,5].index(crit.get("scale", 4)),
+                                              key=f"scale_{crit['id']}")
+                    f_low      = st.text_area(f"Anker für 1 (niedrigster Wert)",
+                                              value=crit.get("anchor_low", ""), height=70)
+                    f_high     = st.text_area(f"Anker für {f_scale} (höchster Wert)",
+                                              value=crit.get("anchor_high", ""), height=70)
+
+                    save_col, cancel_col = st.columns([1, 1])
+                    with save_col:
+                        submitted = st.form_submit_button("Speichern")
+                    with cancel_col:
+                        cancelled = st.form_submit_button("Abbrechen")
+
+                if submitted:
+                    new_crit = {
+                        "id": crit["id"],
+                        "category": f_category.strip(),
+                        "name": f_name.strip(),
+                        "description": f_desc,
+                        "scale": f_scale,
+                        "anchor_low": f_low,
+                        "anchor_high": f_high,
+                        "examples": crit.get("examples", []),
+                    }
+                    st.session_state.Kriterien[idx] = new_crit
+                    st.session_state.editing_id = None
                     st.rerun()
-            with btn_col2:
-                if st.button("Löschen", key=f"del_{crit['id']}", use_container_width=True):
-                    to_delete = crit["id"]
-            with btn_col3:
-                n_ex = len(crit.get("examples", []))
-                ex_text = "Beispiel" if n_ex == 1 else "Beispiele"
-                st.markdown(f"<span style='font-size:0.8rem;color:#888'>{n_ex} {ex_text}</span>", unsafe_allow_html=True)
-
-        # Zeige Edit-Form direkt darunter, wenn dieses Kriterium bearbeitet wird
-        if st.session_state.editing_id == crit["id"]:
-            st.markdown('<div class="edit-form-container">', unsafe_allow_html=True)
-            st.subheader("Kriterium bearbeiten")
-
-            with st.form(f"criterion_form_{crit['id']}"):
-                f_category = st.text_input("Kategorie", value=crit.get("category", ""))
-                f_name     = st.text_input("Kriterium-Name", value=crit.get("name", ""))
-                f_desc     = st.text_area("Beschreibung (wird dem Modell angezeigt)",
-                                          value=crit.get("description", ""), height=90)
-                f_scale    = st.selectbox("Skala", [3, 4, 5],
-                                          index=[3,4,5].index(crit.get("scale", 4)),
-                                          key=f"scale_{crit['id']}")
-                f_low      = st.text_area(f"Anker für 1 (niedrigster Wert)",
-                                          value=crit.get("anchor_low", ""), height=70)
-                f_high     = st.text_area(f"Anker für {f_scale} (höchster Wert)",
-                                          value=crit.get("anchor_high", ""), height=70)
-
-                save_col, cancel_col = st.columns([1, 1])
-                with save_col:
-                    submitted = st.form_submit_button("Speichern")
-                with cancel_col:
-                    cancelled = st.form_submit_button("Abbrechen")
-
-            if submitted:
-                new_crit = {
-                    "id": crit["id"],
-                    "category": f_category,
-                    "name": f_name,
-                    "description": f_desc,
-                    "scale": f_scale,
-                    "anchor_low": f_low,
-                    "anchor_high": f_high,
-                    "examples": crit.get("examples", []),
-                }
-                st.session_state.Kriterien[idx] = new_crit
-                st.session_state.editing_id = None
-                st.rerun()
-
-            if cancelled:
-                st.session_state.editing_id = None
-                st.rerun()
 
-            st.markdown('</div>', unsafe_allow_html=True)
-            st.markdown("---")
-
-    if to_delete:
-        st.session_state.Kriterien = [c for c in st.session_state.Kriterien if c["id"] != to_delete]
-        st.rerun()
+                if cancelled:
+                    st.session_state.editing_id = None
+                    st.rerun()
 
-    # Buttons für Hinzufügen und Reset (nur wenn nicht editiert wird)
-    if st.session_state.editing_id is None:
-        col1, col2 = st.columns([1, 5])
-        with col1:
-            if st.button("Kriterium hinzufügen", use_container_width=True):
-                st.session_state.adding_criterion = True
-                st.rerun()
-        with col2:
-            if st.button("Alle auf Standard zurücksetzen", use_container_width=True):
-                st.session_state.Kriterien = deepcopy(DEFAULT_Kriterien)
-                st.rerun()
+                st.markdown('</div>', unsafe_allow_html=True)
+                st.markdown("---")
 
-        # Add New Form (am Ende, wenn nichts editiert wird)
-        if st.session_state.adding_criterion:
-            st.markdown('<div class="edit-form-container">', unsafe_allow_html=True)
-            st.subheader("Neues Kriterium")
-
-            with st.form("criterion_form_new"):
-                f_category = st.text_input("Kategorie", value="")
-                f_name     = st.text_input("Kriterium-Name", value="")
-                f_desc     = st.text_area("Beschreibung (wird dem Modell angezeigt)",
-                                          value="", height=90)
-                f_scale    = st.selectbox("Skala", [3, 4, 5], index=1)
-                f_low      = st.text_area(f"Anker für 1 (niedrigster Wert)",
-                                          value="", height=70)
-                f_high     = st.text_area(f"Anker für {f_scale} (höchster Wert)",
-                                          value="", height=70)
-
-                save_col, cancel_col = st.columns([1, 1])
-                with save_col:
-                    submitted = st.form_submit_button("Speichern")
-                with cancel_col:
-                    cancelled = st.form_submit_button("Abbrechen")
-
-            if submitted:
-                new_crit = {
-                    "id": str(uuid.uuid4()),
-                    "category": f_category,
-                    "name": f_name,
-                    "description": f_desc,
-                    "scale": f_scale,
-                    "anchor_low": f_low,
-                    "anchor_high": f_high,
-                    "examples": [],
-                }
-                st.session_state.Kriterien.append(new_crit)
-                st.session_state.adding_criterion = False
-                st.rerun()
+        if to_delete:
+            st.session_state.Kriterien = [c for c in st.session_state.Kriterien if c["id"] != to_delete]
+            st.rerun()
 
-            if cancelled:
-                st.session_state.adding_criterion = False
-                st.rerun()
+        # Buttons für Hinzufügen und Reset (nur wenn nicht editiert wird)
+        if st.session_state.editing_id is None:
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                if st.button("Kriterium hinzufügen", use_container_width=True):
+                    st.session_state.adding_criterion = True
+                    st.rerun()
+            with col2:
+                if st.button("Alle auf Standard zurücksetzen", use_container_width=True):
+                    st.session_state.Kriterien = deepcopy(DEFAULT_Kriterien)
+                    st.rerun()
 
-            st.markdown('</div>', unsafe_allow_html=True)
+            # Add New Form (am Ende, wenn nichts editiert wird)
+            if st.session_state.adding_criterion:
+                st.markdown('<div class="edit-form-container">', unsafe_allow_html=True)
+                st.subheader("Neues Kriterium")
+
+                with st.form("criterion_form_new"):
+                    f_category = st.text_input("Kategorie", value="")
+                    f_name     = st.text_input("Kriterium-Name", value="")
+                    f_desc     = st.text_area("Beschreibung (wird dem Modell angezeigt)",
+                                              value="", height=90)
+                    f_scale    = st.selectbox("Skala", [3, 4, 5], index=1)
+                    f_low      = st.text_area(f"Anker für 1 (niedrigster Wert)",
+                                              value="", height=70)
+                    f_high     = st.text_area(f"Anker für {f_scale} (höchster Wert)",
+                                              value="", height=70)
+
+                    save_col, cancel_col = st.columns([1, 1])
+                    with save_col:
+                        submitted = st.form_submit_button("Speichern")
+                    with cancel_col:
+                        cancelled = st.form_submit_button("Abbrechen")
+
+                if submitted:
+                    new_crit = {
+                        "id": str(uuid.uuid4()),
+                        "category": f_category.strip(),
+                        "name": f_name.strip(),
+                        "description": f_desc,
+                        "scale": f_scale,
+                        "anchor_low": f_low,
+                        "anchor_high": f_high,
+                        "examples": [],
+                    }
+                    st.session_state.Kriterien.append(new_crit)
+                    st.session_state.adding_criterion = False
+                    st.rerun()
 
-    render_navigation_bottom()
+                if cancelled:
+                    st.session_state.adding_criterion = False
+                    st.rerun()
 
-# ═══════════════════════════════════════════════════════
-# PAGE 3 – KALIBRIERUNGSBEISPIELE
-# ═══════════════════════════════════════════════════════
-elif page == "Kalibrierungsbeispiele":
-    st.markdown('<div class="step-header">Kalibrierungsbeispiele</div>', unsafe_allow_html=True)
-    st.markdown('<div class="step-sub">Für jedes Kriterium kannst du bewertete Referenz-Unternehmen angeben. Das Modell nutzt diese als Ankerpunkte.</div>', unsafe_allow_html=True)
-
-    for crit_idx, crit in enumerate(st.session_state.Kriterien):
-        with st.expander(f"**{crit['category']} › {crit['name']}** (Skala 1–{crit['scale']})  —  {len(crit['examples'])} Beispiel(e)"):
-            examples = crit["examples"]
-
-            to_remove = None
-            for ex_idx, ex in enumerate(examples):
-                col_score, col_company, col_reason, col_del = st.columns([1, 2, 5, 1])
-                with col_score:
-                    st.markdown(f"<span class='score-pill'>{ex['score']}</span>", unsafe_allow_html=True)
-                with col_company:
-                    st.markdown(f"**{ex['company']}**")
-                with col_reason:
-                    st.markdown(f"<span style='color:#5a6470;font-size:0.88rem'>{ex['reason']}</span>", unsafe_allow_html=True)
-                with col_del:
-                    if st.button("Löschen", key=f"rm_ex_{crit['id']}_{ex_idx}", use_container_width=True):
-                        to_remove = ex_idx
-
-            if to_remove is not None:
-                st.session_state.Kriterien[crit_idx]["examples"].pop(to_remove)
-                st.rerun()
+                st.markdown('</div>', unsafe_allow_html=True)
+
+        render_navigation_bottom()
+
+    # ═══════════════════════════════════════════════════════
+    # PAGE 3 – KALIBRIERUNGSBEISPIELE
+    # ═══════════════════════════════════════════════════════
+    elif page == "Kalibrierungsbeispiele":
+        st.markdown('<div class="step-header">Kalibrierungsbeispiele</div>', unsafe_allow_html=True)
+        st.markdown('<div class="step-sub">Für jedes Kriterium kannst du bewertete Referenz-Unternehmen angeben. Das Modell nutzt diese als Ankerpunkte.</div>', unsafe_allow_html=True)
+        st.caption(
+            f"Pro Unternehmen und Kriterium werden höchstens {MAX_BEISPIELE_PRO_KRITERIUM} Beispiele in den Prompt "
+            "übernommen: zuerst Beispiele mit ähnlichem Unternehmensnamen, danach über die Score-Stufen "
+            "verteilt (niedriger und hoher Anker). So bleibt die Prompt-Größe begrenzt. "
+            f"Alle Beispiele eines Kriteriums teilen sich ca. {BEISPIEL_TOKEN_BUDGET * 4} Zeichen; "
+            "zu lange Begründungen werden gekürzt oder fallen heraus."
+        )
 
-            st.markdown("**Beispiel hinzufügen**")
-            with st.form(f"ex_form_{crit['id']}"):
-                ex_col1, ex_col2, ex_col3 = st.columns([2, 1, 4])
-                with ex_col1:
-                    ex_company = st.text_input("Unternehmen", key=f"exc_{crit['id']}")
-                with ex_col2:
-                    ex_score   = st.selectbox("Wert", list(range(1, crit["scale"] + 1)), key=f"exs_{crit['id']}")
-                with ex_col3:
-                    ex_reason  = st.text_input("Begründung", key=f"exr_{crit['id']}")
-                if st.form_submit_button("Hinzufügen"):
-                    if ex_company.strip():
-                        st.session_state.Kriterien[crit_idx]["examples"].append({
-                            "company": ex_company.strip(),
-                            "score":   ex_score,
-                            "reason":  ex_reason.strip(),
-                        })
-                        st.rerun()
+        for crit_idx, crit in enumerate(st.session_state.Kriterien):
+            with st.expander(f"**{crit['category']} › {crit['name']}** (Skala 1–{crit['scale']})  —  {len(crit['examples'])} Beispiel(e)"):
+                examples = crit["examples"]
+
+                to_remove = None
+                for ex_idx, ex in enumerate(examples):
+                    col_score, col_company, col_reason, col_del = st.columns([1, 2, 5, 1])
+                    with col_score:
+                        st.markdown(f"<span class='score-pill'>{ex['score']}</span>", unsafe_allow_html=True)
+                    with col_company:
+                        st.markdown(f"**{ex['company']}**")
+                    with col_reason:
+                        st.markdown(f"<span style='color:#5a6470;font-size:0.88rem'>{ex['reason']}</span>", unsafe_allow_html=True)
+                        if estimate_tokens(format_example(ex)) > BEISPIEL_TOKEN_BUDGET:
+                            st.caption("Begründung zu lang für das Beispiel-Budget: wird gekürzt und nur übernommen, wenn das Beispiel als erstes ausgewählt wird.")
+                    with col_del:
+                        if st.button("Löschen", key=f"rm_ex_{crit['id']}_{ex_idx}", use_container_width=True):
+                            to_remove = ex_idx
+
+                if to_remove is not None:
+                    st.session_state.Kriterien[crit_idx]["examples"].pop(to_remove)
+                    st.rerun()
 
-    render_navigation_bottom()
+                st.markdown("**Beispiel hinzufügen**")
+                with st.form(f"ex_form_{crit['id']}"):
+                    ex_col1, ex_col2, ex_col3 = st.columns([2, 1, 4])
+                    with ex_col1:
+                        ex_company = st.text_input("Unternehmen", key=f"exc_{crit['id']}")
+                    with ex_col2:
+                        ex_score   = st.selectbox("Wert", list(range(1, crit["scale"] + 1)), key=f"exs_{crit['id']}")
+                    with ex_col3:
+                        ex_reason  = st.text_input("Begründung", key=f"exr_{crit['id']}")
+                    if st.form_submit_button("Hinzufügen"):
+                        if ex_company.strip():
+                            st.session_state.Kriterien[crit_idx]["examples"].append({
+                                "company": ex_company.strip(),
+                                "score":   ex_score,
+                                "reason":  ex_reason.strip(),
+                            })
+                            st.rerun()
+
+        render_navigation_bottom()
+
+    # ═══════════════════════════════════════════════════════
+    # PAGE 4 – ANALYSE DURCHFÜHREN
+    # ═══════════════════════════════════════════════════════
+    elif page == "Analyse durchführen":
+        st.markdown('<div class="step-header">Analyse durchführen</div>', unsafe_allow_html=True)
+        st.markdown('<div class="step-sub">Überprüfe deine Konfiguration und starte die Benchmark-Analyse.</div>', unsafe_allow_html=True)
+
+        Unternehmen = [c.strip() for c in st.session_state.Unternehmen_text.splitlines() if c.strip()]
+        Kriterien  = st.session_state.Kriterien
+
+        with st.expander("Kriterien-Aufteilung (für große Kriterienkataloge)"):
+            shard_col1, shard_col2 = st.columns(2)
+            with shard_col1:
+                st.session_state.shard_nach_kategorie = st.checkbox(
+                    "Nach Kategorie aufteilen",
+                    value=st.session_state.shard_nach_kategorie,
+                    help="Jede Kategorie wird als eigene Anfrage parallel bewertet.",
+                )
+            with shard_col2:
+                st.session_state.shard_max = st.number_input(
+                    "Max. Kriterien pro Anfrage (0 = unbegrenzt)",
+                    min_value=0,
+                    value=st.session_state.shard_max,
+                    step=1,
+                )
+
+        with st.expander("Zeitplanung & Budget"):
+            st.session_state.prioritaet = st.multiselect(
+                "Priorisierte Unternehmen (werden zuerst bearbeitet)",
+                Unternehmen,
+                default=[u for u in st.session_state.prioritaet if u in Unternehmen],
+            )
+            plan_col1, plan_col2 = st.columns(2)
+            with plan_col1:
+                st.session_state.zeitlimit_min = st.number_input(
+                    "Zeitlimit in Minuten (0 = keins)",
+                    min_value=0,
+                    value=st.session_state.zeitlimit_min,
+                    step=5,
+                )
+            with plan_col2:
+                st.session_state.token_budget = st.number_input(
+                    "Token-Budget (0 = keins)",
+                    min_value=0,
+                    value=st.session_state.token_budget,
+                    step=10000,
+                )
+
+        shards = shard_kriterien(Kriterien, st.session_state.shard_nach_kategorie, st.session_state.shard_max)
+        Unternehmen = order_by_priority(Unternehmen, st.session_state.prioritaet)
+        verlauf = load_run_stats()
+        sek_pro_unternehmen, tokens_pro_unternehmen = estimate_company(verlauf, shards)
+
+        col_a, col_b, col_c, col_d, col_e = st.columns(5)
+        col_a.metric("Unternehmen", len(Unternehmen))
+        col_b.metric("Kriterien",  len(Kriterien))
+        col_c.metric("Anfragen pro Unternehmen", len(shards))
+        est_mins = max(1, round(len(Unternehmen) * sek_pro_unternehmen / 60))
+        col_d.metric("Geschätzte Dauer", f"ca. {est_mins} Min.")
+        col_e.metric(
+            "Geschätzte Tokens",
+            f"ca. {len(Unternehmen) * tokens_pro_unternehmen:,}" if tokens_pro_unternehmen else "–",
+        )
+        st.caption(
+            f"Schätzung auf Basis von {min(len(verlauf), RUN_STATS_FENSTER)} protokollierten Anfragen früherer Läufe."
+            if verlauf else "Noch keine protokollierten Läufe – Schätzung mit Standardwert."
+        )
 
-# ═══════════════════════════════════════════════════════
-# PAGE 4 – ANALYSE DURCHFÜHREN
-# ═══════════════════════════════════════════════════════
-elif page == "Analyse durchführen":
-    st.markdown('<div class="step-header">Analyse durchführen</div>', unsafe_allow_html=True)
-    st.markdown('<div class="step-sub">Überprüfe deine Konfiguration und starte die Benchmark-Analyse.</div>', unsafe_allow_html=True)
+        if st.session_state.run_active:
+            # Der letzte Lauf wurde unterbrochen (Abbrechen-Button oder Seitenwechsel)
+            st.session_state.run_active = False
+            st.session_state.run_hinweis = (
+                f"Analyse abgebrochen – {len(st.session_state.results)} abgeschlossene Zeilen wurden behalten."
+            )
+        if st.session_state.run_hinweis:
+            st.warning(st.session_state.run_hinweis)
+
+        if not api_key:
+            st.warning("Bitte gib einen Gemini API Key ein.")
+            st.stop()
+        if not Unternehmen:
+            st.warning("Keine Unternehmen definiert.")
+            st.stop()
+        if not Kriterien:
+            st.warning("Keine Kriterien definiert.")
+            st.stop()
+
+        with st.expander("Prompt-Vorschau (erstes Unternehmen)"):
+            if len(shards) > 1:
+                st.caption(f"Erste von {len(shards)} parallelen Anfragen")
+            st.code(build_prompt(Unternehmen[0], shards[0] if shards else Kriterien), language="markdown")
 
-    Unternehmen = [c.strip() for c in st.session_state.Unternehmen_text.splitlines() if c.strip()]
-    Kriterien  = st.session_state.Kriterien
+        st.markdown("---")
 
-    col_a, col_b, col_c = st.columns(3)
-    col_a.metric("Unternehmen", len(Unternehmen))
-    col_b.metric("Kriterien",  len(Kriterien))
-    est_mins = max(1, round(len(Unternehmen) * 8 / 60))
-    col_c.metric("Geschätzte Dauer", f"ca. {est_mins} Min.")
+        if st.button("Benchmark-Analyse starten", type="primary", use_container_width=True):
+            run_analysis(
+                api_key, Unternehmen, Kriterien, shards,
+                st.session_state.zeitlimit_min, st.session_state.token_budget,
+            )
 
-    if not api_key:
-        st.warning("Bitte gib einen Gemini API Key ein.")
-        st.stop()
-    if not Unternehmen:
-        st.warning("Keine Unternehmen definiert.")
-        st.stop()
-    if not Kriterien:
-        st.warning("Keine Kriterien definiert.")
-        st.stop()
-
-    with st.expander("Prompt-Vorschau (erstes Unternehmen)"):
-        st.code(build_prompt(Unternehmen[0], Kriterien), language="markdown")
+        if st.session_state.results:
+            if not st.session_state.sources_resolved:
+                from sources import resolve_sources
 
-    st.markdown("---")
+                # Quellen-Stufe: Redirect-URLs einmalig auflösen und durch Quellen-IDs ersetzen
+                with st.spinner("Quellen werden aufgelöst..."):
+                    st.session_state.results, st.session_state.sources = resolve_sources(st.session_state.results)
+                st.session_state.sources_resolved = True
+                st.session_state.results_version += 1
 
-    if st.button("Benchmark-Analyse starten", type="primary", use_container_width=True):
-        run_analysis(api_key, Unternehmen, Kriterien)
+            exports = get_exports(st.session_state.results, st.session_state.sources, Kriterien)
 
-    if st.session_state.results:
-        st.markdown("---")
-        st.markdown("### Ergebnisse")
-        df = results_to_df(st.session_state.results, Kriterien)
-        st.dataframe(df, use_container_width=True, height=400)
-
-        dl_col1, dl_col2 = st.columns(2)
-        with dl_col1:
-            csv_bytes = df.to_csv(index=False).encode("utf-8")
-            st.download_button("CSV herunterladen", csv_bytes, "benchmark_results.csv", "text/csv", use_container_width=True)
-        with dl_col2:
-            excel_bytes = to_excel(df)
-            st.download_button("Excel herunterladen", excel_bytes, "benchmark_results.xlsx",
-                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
-
-    render_navigation_bottom()
+            st.markdown("---")
+            st.markdown("### Ergebnisse")
+            st.dataframe(exports["df"], use_container_width=True, height=400)
+
+            with st.expander(f"Quellen ({len(exports['quellen_df'])})"):
+                st.dataframe(exports["quellen_df"], use_container_width=True, hide_index=True)
+
+            dl_col1, dl_col2, dl_col3 = st.columns(3)
+            with dl_col1:
+                st.download_button("CSV herunterladen", exports["csv"], "benchmark_results.csv", "text/csv", use_container_width=True)
+            with dl_col2:
+                st.download_button("Quellen-CSV herunterladen", exports["quellen_csv"], "benchmark_sources.csv", "text/csv", use_container_width=True)
+            with dl_col3:
+                st.download_button("Excel herunterladen", exports["excel"], "benchmark_results.xlsx",
+                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+
+            st.markdown("### Auswertung")
+            render_analytics(st.session_state.results, Kriterien)
+
+        render_navigation_bottom()
+finally:
+    # Läuft auch bei st.stop() und st.rerun(), damit jede Interaktion gemessen wird
+    render_timing(timing_placeholder, timings, laufzeiten)
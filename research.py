@@ -0,0 +1,551 @@
+"""
+Bewertungs-Pipeline ohne Streamlit-Abhängigkeit: Prompt-Aufbau mit
+ausgewählten Kalibrierungsbeispielen, Modell-Anfragen mit Rate-Limit und
+Nachfrage, Validierung der Bewertungen und Umwandlung in Ergebniszeilen.
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Maximale Anzahl gezielter Nachfragen für fehlende/ungültige Kriterien pro Unternehmen
+MAX_NACHFRAGEN = 1
+# Maximale Anzahl parallel laufender Anfragen (Shards) pro Unternehmen
+MAX_PARALLEL_SHARDS = 4
+# Maximale Anzahl Kalibrierungsbeispiele pro Kriterium im Prompt
+MAX_BEISPIELE_PRO_KRITERIUM = 3
+# Token-Budget (geschätzt) für die Kalibrierungsbeispiele eines Kriteriums
+BEISPIEL_TOKEN_BUDGET = 300
+# Mindest-Ähnlichkeit der Unternehmensnamen, ab der ein Beispiel als relevant gilt
+MIN_BEISPIEL_AEHNLICHKEIT = 0.5
+# Mindestabstand zwischen zwei Modell-Anfragen (Rate-Limit, gilt für alle Shard-Threads eines Laufs)
+ANFRAGE_ABSTAND_SEKUNDEN = 3
+
+
+def char_ngrams(text: str, n: int = 3) -> list:
+    """Zerlegt einen Text in Zeichen-N-Gramme (robust gegen Schreibvarianten von Namen)."""
+    text = f" {' '.join(str(text).lower().split())} "
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def tfidf_vector(counts: Counter, idf: dict) -> dict:
+    """Gewichtet Term-Häufigkeiten mit IDF und normiert den Vektor auf Länge 1."""
+    vec = {t: tf * idf[t] for t, tf in counts.items() if t in idf}
+    norm = math.sqrt(sum(w * w for w in vec.values()))
+    return {t: w / norm for t, w in vec.items()} if norm else {}
+
+
+@lru_cache(maxsize=256)
+def build_example_index(examples: tuple):
+    """
+    Baut einmalig pro Beispielbibliothek einen TF-IDF-Index über die
+    Unternehmensnamen der Beispiele. examples: Tupel aus (company, score, reason).
+    N-Gramme, die in allen Namen vorkommen (z. B. "bank"), erhalten das Gewicht 0.
+    """
+    docs = [Counter(char_ngrams(company)) for company, _, _ in examples]
+    df = Counter(t for d in docs for t in d)
+    idf = {t: math.log((1 + len(docs)) / (1 + c)) for t, c in df.items()}
+    return idf, [tfidf_vector(d, idf) for d in docs]
+
+
+def format_example(ex: dict) -> str:
+    """Formatiert ein Kalibrierungsbeispiel als Prompt-Zeile."""
+    return f"  - {ex['company']}: Score {ex['score']} — {ex['reason']}\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Grobe Token-Schätzung (ca. 4 Zeichen pro Token)."""
+    return len(text) // 4 + 1
+
+
+def trim_example(ex: dict, token_budget: int) -> dict:
+    """Kürzt die Begründung eines Beispiels (mit "…"), bis seine Prompt-Zeile ins Token-Budget passt."""
+    if estimate_tokens(format_example(ex)) <= token_budget:
+        return ex
+    # estimate_tokens(text) <= token_budget, solange len(text) <= 4 * token_budget - 1
+    platz = 4 * token_budget - 1 - len(format_example({**ex, "reason": ""})) - 1
+    return {**ex, "reason": ex["reason"][:max(platz, 0)].rstrip() + "…"}
+
+
+def spread_order(examples: list) -> list:
+    """
+    Reihenfolge der Beispiel-Indizes über alle Score-Stufen verteilt: zuerst der
+    niedrigste und der höchste Score, dann die mittleren Stufen, danach reihum
+    weitere Beispiele. Innerhalb einer Stufe kommen neuere Beispiele zuerst.
+    """
+    stufen = {}
+    for i in reversed(range(len(examples))):
+        stufen.setdefault(examples[i]["score"], []).append(i)
+    scores = sorted(stufen)
+    reihenfolge = scores[:1] + scores[-1:] + scores[1:-1] if len(scores) > 1 else scores
+
+    ergebnis = []
+    while any(stufen[sc] for sc in reihenfolge):
+        for sc in reihenfolge:
+            if stufen[sc]:
+                ergebnis.append(stufen[sc].pop(0))
+    return ergebnis
+
+
+def select_examples(company_name: str, examples: list,
+                    k: int = MAX_BEISPIELE_PRO_KRITERIUM, token_budget: int = BEISPIEL_TOKEN_BUDGET) -> list:
+    """
+    Wählt bis zu k Kalibrierungsbeispiele innerhalb des Token-Budgets aus.
+    Zuerst kommen Beispiele, deren Unternehmensname dem Unternehmen deutlich
+    ähnelt (TF-IDF ab MIN_BEISPIEL_AEHNLICHKEIT), z. B. Vorjahresbewertungen desselben
+    Unternehmens. Die übrigen Plätze werden über die Score-Stufen verteilt
+    aufgefüllt, sodass möglichst ein niedriger und ein hoher Anker enthalten sind.
+    Die Prompt-Größe bleibt so unabhängig von der Größe der Beispielbibliothek begrenzt.
+    Das erstplatzierte Beispiel wird nie verworfen: Sprengt es allein das
+    Budget, wird seine Begründung gekürzt (siehe trim_example).
+    """
+    if not examples:
+        return []
+
+    idf, vectors = build_example_index(
+        tuple((ex["company"], ex["score"], ex["reason"]) for ex in examples)
+    )
+    query = tfidf_vector(Counter(char_ngrams(company_name)), idf)
+    sims = [sum(w * vec.get(t, 0.0) for t, w in query.items()) for vec in vectors]
+    relevant = sorted(
+        (i for i in range(len(examples)) if sims[i] >= MIN_BEISPIEL_AEHNLICHKEIT),
+        key=lambda i: (-sims[i], -i),
+    )
+
+    scores = [ex["score"] for ex in examples]
+    anker = {min(scores), max(scores)}
+    auswahl, verbraucht = {}, 0
+
+    def hinzufuegen(i: int, reserviert: int = 0) -> bool:
+        nonlocal verbraucht
+        ex = examples[i] if auswahl else trim_example(examples[i], token_budget)
+        kosten = estimate_tokens(format_example(ex))
+        if i in auswahl or len(auswahl) + 1 + reserviert > k or verbraucht + kosten > token_budget:
+            return False
+        auswahl[i] = ex
+        verbraucht += kosten
+        return True
+
+    for i in relevant:
+        # Plätze für noch fehlende Skalenanker freihalten (erst ab k > 2 sinnvoll)
+        fehlend = anker - {examples[j]["score"] for j in auswahl} - {examples[i]["score"]}
+        hinzufuegen(i, len(fehlend) if k > 2 else 0)
+    # Zuerst noch nicht vertretene Score-Stufen auffüllen, danach beliebige
+    reihenfolge = spread_order(examples)
+    for i in reihenfolge:
+        if examples[i]["score"] not in {examples[j]["score"] for j in auswahl}:
+            hinzufuegen(i)
+    for i in reihenfolge:
+        hinzufuegen(i)
+
+    return list(auswahl.values())
+
+
+def build_kriterien_block(Kriterien: list, company_name: str) -> str:
+    """
+    Erstellt den nummerierten Kriterien-Block inkl. Skalenanker und der für das
+    Unternehmen ausgewählten Kalibrierungsbeispiele.
+    """
+    Kriterien_block = ""
+    for i, c in enumerate(Kriterien, 1):
+        Kriterien_block += f"""
+{i}. {c['category'].upper()} – {c['name']}
+
+{c['description']}
+
+Skalenanker:
+1 = {c['anchor_low']}
+{c['scale']} = {c['anchor_high']}
+"""
+        beispiele = select_examples(company_name, c.get("examples", []))
+        if beispiele:
+            Kriterien_block += "\nKalibrierungsbeispiele:\n"
+            for ex in beispiele:
+                Kriterien_block += format_example(ex)
+        Kriterien_block += "\n---\n"
+    return Kriterien_block
+
+
+def build_json_example(Kriterien: list) -> str:
+    """Erstellt die Beispiel-Einträge für das JSON-Ausgabeformat."""
+    json_example_items = ""
+    for c in Kriterien:
+        json_example_items += f"""    {{
+      "kategorie": "{c['category']}",
+      "kriterium": "{c['name']}",
+      "score": "1-{c['scale']}",
+      "begruendung": "..."
+    }},
+"""
+    return json_example_items.rstrip(",\n")
+
+
+def build_prompt_header() -> str:
+    """Rolle und Kontext, gemeinsam für Analyse- und Nachfrage-Prompt."""
+    return """<rolle>
+Du bist ein unabhängiger, erfahrener Finanz- und Strategieberater.
+Du arbeitest faktenbasiert, kritisch, vergleichend und nachvollziehbar.
+</rolle>
+
+<kontext>
+Du bewertest Finanz- und FinTech-Unternehmen anhand öffentlich zugänglicher Informationen für das Jahr 2025.
+</kontext>
+"""
+
+
+def build_recherche_hinweis() -> str:
+    """Anweisung zur Web-Recherche und zum Stil der Begründungen."""
+    return """Führe eine gezielte Web-Recherche durch. Nutze ausschließlich überprüfbare Quellen.
+Wichtig: Schreibe die Begründungen in klaren, faktischen Sätzen. Vermeide vage Formulierungen, damit die Quellen eindeutig zugeordnet werden können."""
+
+
+def build_bewertungssystem() -> str:
+    """Bewertungsmaßstab, gemeinsam für Analyse- und Nachfrage-Prompt."""
+    return """<bewertungssystem>
+Nutze die definierte Skala pro Kriterium. Bewerte relativ zum Marktumfeld.
+</bewertungssystem>
+"""
+
+
+def build_prompt(company_name: str, Kriterien: list) -> str:
+    """Erstellt den Analyse-Prompt basierend auf den konfigurierten Kriterien."""
+
+    Kriterien_block = build_kriterien_block(Kriterien, company_name)
+    json_example_items_clean = build_json_example(Kriterien)
+
+    prompt = f"""{build_prompt_header()}
+<aufgabe>
+Analysiere und bewerte das folgende Unternehmen: {company_name}
+
+{build_recherche_hinweis()}
+</aufgabe>
+
+{build_bewertungssystem()}
+<kriterien>
+{Kriterien_block}
+</kriterien>
+
+<ausgabeformat>
+Gib die Antwort AUSSCHLIESSLICH als valides JSON zurück.
+
+{{
+  "unternehmen": "{company_name}",
+  "bewertungen": [
+{json_example_items_clean}
+  ],
+  "hinweise_zur_datenlage": "Hinweise zu Datenlücken oder Vergleichbarkeit."
+}}
+</ausgabeformat>
+"""
+    return prompt
+
+
+def extract_json(text: str):
+    """Extrahiert JSON-Inhalte aus dem KI-Antworttext."""
+    try:
+        match = re.search(r'\{.*\}', text, re.DOTALL)
+        if match:
+            return json.loads(match.group())
+    except Exception:
+        pass
+    return None
+
+
+def extract_bewertungen_teilweise(text: str) -> list:
+    """
+    Rettet einzelne Bewertungsobjekte aus einer abgeschnittenen oder
+    fehlerhaften Antwort, wenn das Gesamt-JSON nicht gelesen werden kann.
+    """
+    items = []
+    for match in re.finditer(r'\{[^{}]*"kriterium"[^{}]*\}', text or "", re.DOTALL):
+        try:
+            items.append(json.loads(match.group()))
+        except Exception:
+            continue
+    return items
+
+
+def parse_score(value, scale: int):
+    """Wandelt einen Score in eine Ganzzahl im Bereich 1..scale um, sonst None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)) and float(value).is_integer():
+        score = int(value)
+    elif isinstance(value, str) and value.strip().isdecimal():
+        try:
+            score = int(value.strip())
+        except ValueError:
+            return None
+    else:
+        return None
+    return score if 1 <= score <= scale else None
+
+
+def kriterium_key(kategorie, kriterium) -> tuple:
+    """
+    Vergleichsschlüssel eines Kriteriums, gleich für Konfiguration und
+    Modellantwort: ohne Rand-Leerzeichen und ohne Groß-/Kleinschreibung.
+    """
+    return (str(kategorie or "").strip().casefold(), str(kriterium or "").strip().casefold())
+
+
+def validate_bewertungen(bewertungen: list, Kriterien: list):
+    """
+    Prüft jedes Kriterium auf Vorhandensein, ganzzahligen Score innerhalb
+    der Skala und nicht-leere Begründung.
+    Gibt die gültigen Einträge (Schlüssel: Kategorie, Name) und die Liste der
+    fehlenden oder ungültigen Kriterien zurück.
+    """
+    lookup = {}
+    for b in bewertungen:
+        if not isinstance(b, dict):
+            continue
+        lookup[kriterium_key(b.get("kategorie"), b.get("kriterium"))] = b
+
+    gueltig = {}
+    offen = []
+    for c in Kriterien:
+        key = kriterium_key(c["category"], c["name"])
+        b = lookup.get(key)
+        score = parse_score(b.get("score"), c["scale"]) if b else None
+        begruendung = str(b.get("begruendung", "")).strip() if b else ""
+        if score is None or not begruendung:
+            offen.append(c)
+        else:
+            gueltig[key] = {**b, "score": score, "begruendung": begruendung}
+    return gueltig, offen
+
+
+def build_followup_prompt(company_name: str, Kriterien: list) -> str:
+    """Erstellt einen kurzen Nachfrage-Prompt nur für fehlende oder ungültige Kriterien."""
+    return f"""{build_prompt_header()}
+<aufgabe>
+Bewerte das Unternehmen {company_name} ausschließlich anhand der folgenden Kriterien.
+Jeder Score muss eine ganze Zahl innerhalb der angegebenen Skala sein.
+
+{build_recherche_hinweis()}
+</aufgabe>
+
+{build_bewertungssystem()}
+<kriterien>
+{build_kriterien_block(Kriterien, company_name)}
+</kriterien>
+
+<ausgabeformat>
+Gib die Antwort AUSSCHLIESSLICH als valides JSON zurück.
+
+{{
+  "unternehmen": "{company_name}",
+  "bewertungen": [
+{build_json_example(Kriterien)}
+  ]
+}}
+</ausgabeformat>
+"""
+
+
+def create_rate_limiter(abstand: float = ANFRAGE_ABSTAND_SEKUNDEN) -> dict:
+    """Erzeugt einen threadsicheren Rate-Limiter (Mindestabstand zwischen Anfragen)."""
+    return {"lock": threading.Lock(), "abstand": abstand, "naechster": 0.0}
+
+
+def wait_for_slot(limiter: dict):
+    """
+    Reserviert den nächsten freien Anfrage-Slot und wartet bis zu dessen Beginn.
+    Die Reservierung erfolgt unter dem Lock, das Warten außerhalb, damit
+    parallele Shards nacheinander im Mindestabstand starten.
+    """
+    with limiter["lock"]:
+        jetzt = time.monotonic()
+        start = max(jetzt, limiter["naechster"])
+        limiter["naechster"] = start + limiter["abstand"]
+    if start > jetzt:
+        time.sleep(start - jetzt)
+
+
+def request_bewertungen(client, config, prompt: str, Kriterien: list, protokoll: list = None,
+                        limiter: dict = None) -> dict:
+    """
+    Sendet einen Prompt an das Modell und gibt die gelesenen JSON-Daten zurück.
+    Jede Bewertung erhält die Grounding-Metadaten ihrer Antwort, damit die
+    Quellen auch nach dem Zusammenführen mehrerer Anfragen korrekt zugeordnet werden.
+    Latenz und Token-Verbrauch werden optional im Protokoll festgehalten
+    (ohne Wartezeit im Rate-Limiter).
+    """
+    if limiter is not None:
+        wait_for_slot(limiter)
+    start = time.perf_counter()
+    response = client.models.generate_content(
+        model="gemini-2.0-flash",
+        contents=prompt,
+        config=config,
+    )
+
+    if protokoll is not None:
+        usage = getattr(response, "usage_metadata", None)
+        protokoll.append({
+            "sekunden": round(time.perf_counter() - start, 3),
+            "kriterien": len(Kriterien),
+            "tokens": getattr(usage, "total_token_count", None) or 0,
+        })
+
+    metadata = response.candidates[0].grounding_metadata
+    data = extract_json(response.text)
+    if not data or not isinstance(data.get("bewertungen"), list):
+        data = {"bewertungen": extract_bewertungen_teilweise(response.text)}
+
+    for b in data["bewertungen"]:
+        if isinstance(b, dict):
+            b["_metadata"] = metadata
+    return data
+
+
+def shard_kriterien(Kriterien: list, nach_kategorie: bool = False, max_pro_anfrage: int = 0) -> list:
+    """
+    Teilt die Kriterien in Gruppen (Shards) auf, die als getrennte Anfragen
+    parallel bewertet werden. Optional nach Kategorie und/oder nach maximaler
+    Anzahl Kriterien pro Anfrage (0 = unbegrenzt). Die Reihenfolge bleibt erhalten.
+    """
+    if nach_kategorie:
+        gruppen = {}
+        for c in Kriterien:
+            gruppen.setdefault(c["category"], []).append(c)
+        shards = list(gruppen.values())
+    else:
+        shards = [list(Kriterien)]
+
+    if max_pro_anfrage and max_pro_anfrage > 0:
+        shards = [
+            shard[i:i + max_pro_anfrage]
+            for shard in shards
+            for i in range(0, len(shard), max_pro_anfrage)
+        ]
+    return [shard for shard in shards if shard]
+
+
+def analyse_shard(client, config, company: str, Kriterien: list, protokoll: list = None,
+                  limiter: dict = None):
+    """
+    Bewertet ein Unternehmen für eine Gruppe von Kriterien und fragt fehlende
+    oder ungültige Kriterien gezielt nach.
+    Gibt die Rohdaten, die gültigen Einträge und die offenen Kriterien zurück.
+    """
+    data = request_bewertungen(client, config, build_prompt(company, Kriterien), Kriterien, protokoll, limiter)
+    gueltig, offen = validate_bewertungen(data["bewertungen"], Kriterien)
+
+    nachfragen = 0
+    while offen and nachfragen < MAX_NACHFRAGEN:
+        nachfragen += 1
+        try:
+            nachtrag = request_bewertungen(
+                client, config, build_followup_prompt(company, offen), offen, protokoll, limiter
+            )
+        except Exception:
+            break
+        neu, offen = validate_bewertungen(nachtrag["bewertungen"], offen)
+        gueltig.update(neu)
+
+    return data, gueltig, offen
+
+
+def analyse_company(client, config, company: str, Kriterien: list, shards: list = None, protokoll: list = None,
+                    limiter: dict = None):
+    """
+    Bewertet ein Unternehmen, bei mehreren Shards parallel, und führt die
+    Teilergebnisse zu einer Zeile zusammen.
+    Gibt die Ergebniszeile und eine Log-Meldung zurück.
+    """
+    shards = shards or [Kriterien]
+
+    teile = []
+    fehler = []
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_SHARDS, len(shards))) as pool:
+        futures = [pool.submit(analyse_shard, client, config, company, shard, protokoll, limiter) for shard in shards]
+        for shard, future in zip(shards, futures):
+            try:
+                teile.append(future.result())
+            except Exception as e:
+                # Ein fehlgeschlagener Shard macht nur seine Kriterien ungültig
+                fehler.append(e)
+                teile.append(({"bewertungen": []}, {}, shard))
+
+    if len(fehler) == len(shards):
+        raise fehler[0]
+
+    gueltig, offen, hinweise = {}, [], []
+    for data, shard_gueltig, shard_offen in teile:
+        gueltig.update(shard_gueltig)
+        offen += shard_offen
+        hinweis = str(data.get("hinweise_zur_datenlage", "")).strip()
+        if hinweis and hinweis not in hinweise:
+            hinweise.append(hinweis)
+
+    if not gueltig:
+        return (
+            {"Unternehmen": company, "Status": "Fehler beim Auslesen der Daten"},
+            f"Fehler: {company} (JSON konnte nicht gelesen werden)",
+        )
+
+    # Nur validierte Einträge übernehmen; offene Kriterien bleiben leer statt ungültige Werte zu exportieren
+    merged = {
+        "bewertungen": list(gueltig.values()),
+        "hinweise_zur_datenlage": "\n".join(hinweise),
+    }
+    row = parse_response(merged, company, Kriterien)
+    if offen:
+        row["Status"] = f"Unvollständig: {len(offen)} Kriterien ohne gültige Bewertung"
+        return row, f"Unvollständig: {company} ({len(offen)} Kriterien offen)"
+    return row, f"Erfolg: {company}"
+
+
+def get_granular_sources(text_to_check: str, metadata) -> list:
+    """
+    Identifiziert spezifische URLs aus den Grounding-Metadaten, 
+    die direkt mit dem übergebenen Textsegment verknüpft sind.
+    """
+    if not metadata or not hasattr(metadata, 'grounding_supports'):
+        return []
+
+    found_urls = []
+    for support in metadata.grounding_supports:
+        support_text = support.segment.text
+        # Prüfung auf Überschneidung zwischen Begründungstext und Quell-Segment
+        if support_text in text_to_check or text_to_check in support_text:
+            for index in support.grounding_chunk_indices:
+                if index < len(metadata.grounding_chunks):
+                    chunk = metadata.grounding_chunks[index]
+                    if chunk.web:
+                        found_urls.append(chunk.web.uri)
+    
+    return sorted(list(set(found_urls)))
+
+
+def parse_response(data: dict, company: str, Kriterien: list, metadata=None) -> dict:
+    """Wandelt die JSON-Antwort und Metadaten in ein flaches Dictionary für den Export um."""
+    row = {"Unternehmen": company, "Status": "OK"}
+    bewertungen = data.get("bewertungen", [])
+
+    lookup = {}
+    for b in bewertungen:
+        if not isinstance(b, dict):
+            continue
+        lookup[kriterium_key(b.get("kategorie"), b.get("kriterium"))] = b
+
+    for c in Kriterien:
+        col_base = f"{c['category']} - {c['name']}"
+        b = lookup.get(kriterium_key(c["category"], c["name"]), {})
+        
+        begruendung = b.get("begruendung", "")
+        # Granulares Mapping der Quellen pro Kriterium (Metadaten der jeweiligen Anfrage)
+        quellen_liste = get_granular_sources(begruendung, b.get("_metadata", metadata))
+        
+        row[f"{col_base} | Score"] = b.get("score", "")
+        row[f"{col_base} | Begründung"] = begruendung
+        row[f"{col_base} | Quellen"] = "\n".join(quellen_liste)
+
+    row["Hinweise Datenlage"] = data.get("hinweise_zur_datenlage", "")
+    return row
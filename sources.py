@@ -0,0 +1,140 @@
+"""
+Quellen-Auflösung: Grounding-Redirect-URLs werden dedupliziert, parallel zu
+kanonischen URLs aufgelöst und einmalig in einer Quellentabelle abgelegt,
+auf die die Ergebniszeilen per ID verweisen.
+"""
+import os
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag
+
+from storage import load_json, update_json
+
+# Persistenter Cache (Redirect-URL -> kanonische URL) über Läufe hinweg
+SOURCE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".source_cache.json")
+# Maximale Anzahl gespeicherter Cache-Einträge (älteste fallen heraus)
+SOURCE_CACHE_MAX = 5000
+# Timeout pro Auflösung in Sekunden
+RESOLVE_TIMEOUT = 5
+# Maximale Anzahl parallel laufender Auflösungen
+MAX_PARALLEL_RESOLVES = 16
+# Suffix der Quellen-Spalten in den Ergebniszeilen
+QUELLEN_SUFFIX = " | Quellen"
+
+
+def load_source_cache(path: str = SOURCE_CACHE_PATH) -> dict:
+    """Lädt den Cache aufgelöster URLs."""
+    return load_json(path, {})
+
+
+def save_source_cache(neue: dict, path: str = SOURCE_CACHE_PATH):
+    """
+    Ergänzt den gespeicherten Cache um neu aufgelöste URLs (begrenzt auf die
+    neuesten Einträge). Einträge paralleler Sessions bleiben erhalten.
+    """
+    if neue:
+        update_json(path, {}, lambda cache: dict(list({**cache, **neue}.items())[-SOURCE_CACHE_MAX:]))
+
+
+def resolve_url(url: str, timeout: float = RESOLVE_TIMEOUT):
+    """
+    Folgt den Weiterleitungen einer URL und gibt die kanonische Ziel-URL
+    (ohne Fragment) zurück. Es wird nur ein HEAD-Request gesendet; lehnt der
+    Server HEAD ab, wird per GET aufgelöst, ohne den Inhalt zu lesen.
+    Gibt None zurück, wenn die URL nicht aufgelöst werden konnte (Timeout,
+    Rate-Limit, Auth- oder Serverfehler, Fehler ohne Weiterleitung).
+    """
+    for method in ("HEAD", "GET"):
+        request = urllib.request.Request(url, method=method, headers={"User-Agent": "Mozilla/5.0"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return urldefrag(response.geturl())[0]
+        except urllib.error.HTTPError as e:
+            if method == "HEAD" and e.code in (403, 405, 501):
+                continue
+            ziel = e.geturl()
+            # Rate-Limits, Auth-Fehler und Serverfehler sind vorübergehend bzw. nicht aufgelöst
+            if e.code in (401, 403, 407, 429) or e.code >= 500:
+                return None
+            # Eine Fehlerseite (z. B. 404) zählt nur, wenn vorher tatsächlich eine Weiterleitung gefolgt wurde
+            if not ziel or ziel == url:
+                return None
+            return urldefrag(ziel)[0]
+        except Exception:
+            return None
+    return None
+
+
+def resolve_urls(urls, cache: dict = None, timeout: float = RESOLVE_TIMEOUT,
+                 max_workers: int = MAX_PARALLEL_RESOLVES) -> dict:
+    """
+    Löst URLs dedupliziert und parallel auf. Bereits aufgelöste URLs kommen aus
+    dem Cache, neue Ergebnisse werden dort ergänzt. Nicht auflösbare URLs werden
+    unverändert übernommen und nicht gecacht, damit ein späterer Lauf es erneut versucht.
+    Gibt ein Mapping URL -> kanonische URL zurück.
+    """
+    cache = {} if cache is None else cache
+    eindeutig = {u for u in urls if u}
+    offen = sorted(u for u in eindeutig if u not in cache)
+
+    if offen:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(offen))) as pool:
+            for url, kanonisch in zip(offen, pool.map(lambda u: resolve_url(u, timeout), offen)):
+                if kanonisch:
+                    cache[url] = kanonisch
+
+    return {u: cache.get(u, u) for u in eindeutig}
+
+
+def collect_urls(results: list) -> list:
+    """Sammelt alle URLs aus den Quellen-Spalten der Ergebniszeilen."""
+    urls = []
+    for row in results:
+        for key, value in row.items():
+            if key.endswith(QUELLEN_SUFFIX) and value:
+                urls += [u for u in str(value).splitlines() if u.strip()]
+    return urls
+
+
+def build_source_table(results: list, aufgeloest: dict):
+    """
+    Ersetzt die URLs in den Quellen-Spalten durch Quellen-IDs (z. B. "Q1, Q4").
+    Redirect-URLs mit gleichem Ziel teilen sich eine ID.
+    Gibt die neuen Ergebniszeilen und die Quellentabelle (ID, URL) zurück.
+    """
+    ids = {}
+    neue_results = []
+    for row in results:
+        neu = dict(row)
+        for key, value in row.items():
+            if not key.endswith(QUELLEN_SUFFIX) or not value:
+                continue
+            zeilen_ids = []
+            for url in str(value).splitlines():
+                if not url.strip():
+                    continue
+                kanonisch = aufgeloest.get(url, url)
+                if kanonisch not in ids:
+                    ids[kanonisch] = f"Q{len(ids) + 1}"
+                if ids[kanonisch] not in zeilen_ids:
+                    zeilen_ids.append(ids[kanonisch])
+            neu[key] = ", ".join(zeilen_ids)
+        neue_results.append(neu)
+
+    tabelle = [{"ID": quelle_id, "URL": url} for url, quelle_id in ids.items()]
+    return neue_results, tabelle
+
+
+def resolve_sources(results: list, cache_path: str = SOURCE_CACHE_PATH,
+                    timeout: float = RESOLVE_TIMEOUT):
+    """
+    Quellen-Stufe eines Laufs: sammelt alle URLs, löst sie (mit persistentem
+    Cache) auf und gibt die Ergebniszeilen mit Quellen-IDs sowie die
+    Quellentabelle zurück.
+    """
+    cache = load_source_cache(cache_path)
+    bekannt = set(cache)
+    aufgeloest = resolve_urls(collect_urls(results), cache, timeout)
+    save_source_cache({u: k for u, k in cache.items() if u not in bekannt}, cache_path)
+    return build_source_table(results, aufgeloest)
@@ -0,0 +1,50 @@
+"""
+Lokale JSON-Dateien (Quellen-Cache, Laufzeit-Protokoll): robustes Laden,
+atomares Schreiben und Zusammenführen mit dem aktuellen Dateistand.
+"""
+import json
+import os
+import threading
+
+# Serialisiert Lesen-Zusammenführen-Schreiben aller Sessions dieses Prozesses
+_UPDATE_LOCK = threading.Lock()
+
+
+def load_json(path: str, default):
+    """
+    Lädt eine JSON-Datei. Fehlt sie, ist sie beschädigt oder hat ihr
+    Top-Level-Wert einen anderen Typ als default, wird default zurückgegeben.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return default
+    return data if isinstance(data, type(default)) else default
+
+
+def save_json_atomic(path: str, data):
+    """
+    Schreibt data über eine temporäre Datei und os.replace, damit Leser nie
+    ein halb geschriebenes JSON sehen. Schreibfehler werden ignoriert.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def update_json(path: str, default, merge):
+    """
+    Liest die Datei unmittelbar vor dem Schreiben erneut ein und speichert
+    merge(aktueller_stand). So gehen Einträge, die eine andere Session seit
+    dem eigenen Laden geschrieben hat, nicht verloren.
+    """
+    with _UPDATE_LOCK:
+        save_json_atomic(path, merge(load_json(path, default)))
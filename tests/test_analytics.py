@@ -0,0 +1,128 @@
+"""Tests der vektorisierten Auswertung (Score-Matrix, Normalisierung, Ranking, Cluster)."""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+
+KRITERIEN = [
+    {"category": "Markt", "name": "Reichweite", "scale": 3},
+    {"category": "Markt", "name": "Wachstum", "scale": 4},
+    {"category": "Technologie", "name": "Plattform", "scale": 5},
+]
+
+
+def _zeile(company: str, *scores) -> dict:
+    row = {"Unternehmen": company, "Status": "OK"}
+    for c, score in zip(KRITERIEN, scores):
+        row[analytics.criterion_column(c) + analytics.SCORE_SUFFIX] = score
+    return row
+
+
+class ScoreMatrixTest(unittest.TestCase):
+    def test_ungueltige_scores_werden_nan(self):
+        matrix = analytics.score_matrix(
+            [
+                _zeile("A", 3, "4", 5),
+                _zeile("B", 4, 0, "hoch"),    # 4 > Skala 3, 0 < 1, Text
+                _zeile("C", None, "", 2.0),
+                {"Unternehmen": "D", "Status": "Fehler beim Auslesen der Daten"},
+            ],
+            KRITERIEN,
+        )
+
+        self.assertEqual(list(matrix.index), ["A", "B", "C", "D"])
+        self.assertEqual(matrix.loc["A"].tolist(), [3.0, 4.0, 5.0])
+        self.assertTrue(matrix.loc["B"].isna().all())
+        self.assertTrue(np.isnan(matrix.loc["C", "Markt - Reichweite"]))
+        self.assertEqual(matrix.loc["C", "Technologie - Plattform"], 2.0)
+        self.assertTrue(matrix.loc["D"].isna().all())
+
+    def test_doppelte_unternehmen_behalten_letzte_zeile(self):
+        matrix = analytics.score_matrix([_zeile("A", 1, 1, 1), _zeile("B", 2, 2, 2), _zeile("A", 3, 4, 5)], KRITERIEN)
+
+        self.assertEqual(sorted(matrix.index), ["A", "B"])
+        self.assertEqual(matrix.loc["A"].tolist(), [3.0, 4.0, 5.0])
+
+
+class NormalizeScoresTest(unittest.TestCase):
+    def test_gemischte_skalen_auf_null_bis_eins(self):
+        matrix = pd.DataFrame(
+            [[1, 1, 1], [2, 3, 3], [3, 4, 5]],
+            index=["niedrig", "mitte", "hoch"],
+            columns=[analytics.criterion_column(c) for c in KRITERIEN],
+            dtype=float,
+        )
+
+        normalisiert = analytics.normalize_scores(matrix, KRITERIEN)
+
+        self.assertEqual(normalisiert.loc["niedrig"].tolist(), [0.0, 0.0, 0.0])
+        self.assertEqual(normalisiert.loc["hoch"].tolist(), [1.0, 1.0, 1.0])
+        np.testing.assert_allclose(normalisiert.loc["mitte"], [0.5, 2 / 3, 0.5])
+
+
+class RankingsTest(unittest.TestCase):
+    def test_gleichstand_und_unbewertete_zuletzt(self):
+        results = [
+            _zeile("Leer", None, None, None),
+            _zeile("B", 2, 3, 3),
+            _zeile("A", 3, 2, None),
+            _zeile("C", 2, 3, 3),
+            _zeile("D", 1, 1, 1),
+        ]
+        ranking = analytics.build_analytics(results, KRITERIEN)["ranking"]
+
+        self.assertEqual(list(ranking.index[:1]), ["A"])
+        self.assertEqual(ranking.loc["B", "Rang"], 2)
+        self.assertEqual(ranking.loc["C", "Rang"], 2)
+        self.assertEqual(ranking.loc["D", "Rang"], 4)
+        self.assertEqual(ranking.index[-1], "Leer")
+        self.assertTrue(np.isnan(ranking.loc["Leer", "Rang"]))
+        self.assertEqual(ranking.loc["Leer", "Abdeckung"], 0)
+        self.assertAlmostEqual(ranking.loc["A", "Abdeckung"], 2 / 3)
+
+
+class KmeansTest(unittest.TestCase):
+    def test_mehr_cluster_als_unternehmen(self):
+        profile = np.array([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]])
+        labels = analytics.kmeans(profile, 10)
+
+        self.assertEqual(len(labels), 3)
+        self.assertEqual(len(set(labels)), 3)
+
+    def test_identische_profile_ein_cluster(self):
+        labels = analytics.kmeans(np.ones((5, 3)), 3)
+        self.assertEqual(len(set(labels)), 1)
+
+    def test_ohne_unternehmen(self):
+        self.assertEqual(len(analytics.kmeans(np.zeros((0, 3)), 3)), 0)
+
+
+class ClustersTest(unittest.TestCase):
+    def test_kategorie_namens_unternehmen_oder_anzahl(self):
+        for kategorie in ("Unternehmen", "Anzahl"):
+            kriterien = [dict(KRITERIEN[0]), dict(KRITERIEN[1], category=kategorie)]
+            results = [
+                {
+                    "Unternehmen": name,
+                    f"Markt - Reichweite{analytics.SCORE_SUFFIX}": a,
+                    f"{kategorie} - Wachstum{analytics.SCORE_SUFFIX}": b,
+                }
+                for name, a, b in [("A", 1, 4), ("B", 3, 1), ("C", 1, 4), ("D", 3, 2)]
+            ]
+
+            zuordnung, profil = analytics.clusters(analytics.build_analytics(results, kriterien), 2)
+
+            self.assertTrue(profil.columns.is_unique, kategorie)
+            self.assertEqual(profil.iloc[:, 0].sum(), 4)
+            self.assertEqual(list(profil.columns[1:]), ["Markt", kategorie])
+            self.assertEqual(zuordnung["A"], zuordnung["C"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Tests der Quellen-Auflösung gegen einen lokalen HTTP-Server als Stand-in für die Grounding-Redirects."""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sources  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    zugriffe = []
+
+    def log_message(self, *args):
+        pass
+
+    def _antwort(self, code: int, location: str = None):
+        _Handler.zugriffe.append((self.command, self.path))
+        self.send_response(code)
+        if location:
+            self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        if self.path.startswith("/redirect/"):
+            ziel = self.path.split("/")[2].split("-")[0]
+            self._antwort(302, f"/page/{ziel}#abschnitt")
+        elif self.path == "/nohead":
+            self._antwort(405)
+        elif self.path in ("/busy", "/forbidden-head"):
+            self._antwort(429 if self.path == "/busy" else 403)
+        elif self.path == "/noauth":
+            self._antwort(401)
+        elif self.path == "/missing":
+            self._antwort(404)
+        elif self.path == "/redirect-404":
+            self._antwort(302, "/gone")
+        elif self.path == "/gone":
+            self._antwort(404)
+        elif self.path == "/slow":
+            time.sleep(1)
+            self._antwort(200)
+        else:
+            self._antwort(200)
+
+    def do_GET(self):
+        if self.path == "/nohead":
+            self._antwort(302, "/page/via-get")
+        elif self.path in ("/busy", "/noauth", "/missing", "/gone"):
+            self.do_HEAD()
+        elif self.path == "/forbidden-head":
+            self._antwort(429)
+        else:
+            self._antwort(200)
+
+
+class _Server(ThreadingHTTPServer):
+    # Genug Backlog für die parallelen Auflösungen
+    request_queue_size = 64
+
+
+class ResolveSourcesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _Handler.zugriffe = []
+        fd, self.cache_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.remove(self.cache_path)
+
+    def tearDown(self):
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def test_redirect_wird_zur_kanonischen_url_ohne_fragment(self):
+        self.assertEqual(sources.resolve_url(f"{self.base}/redirect/a-1"), f"{self.base}/page/a")
+
+    def test_head_abgelehnt_faellt_auf_get_zurueck(self):
+        self.assertEqual(sources.resolve_url(f"{self.base}/nohead"), f"{self.base}/page/via-get")
+
+    def test_vorlaeufige_fehler_werden_nicht_aufgeloest(self):
+        for pfad in ("/busy", "/noauth", "/missing", "/forbidden-head"):
+            self.assertIsNone(sources.resolve_url(f"{self.base}{pfad}"), pfad)
+
+    def test_weiterleitung_auf_fehlerseite_zaehlt_als_aufgeloest(self):
+        self.assertEqual(sources.resolve_url(f"{self.base}/redirect-404"), f"{self.base}/gone")
+
+    def test_timeout_liefert_none(self):
+        self.assertIsNone(sources.resolve_url(f"{self.base}/slow", timeout=0.2))
+
+    def test_resolve_sources_dedupliziert_und_cacht(self):
+        results = [
+            {"Unternehmen": "A", "K | Quellen": "\n".join(f"{self.base}/redirect/{i % 2}-{i}" for i in range(6))},
+            {"Unternehmen": "B", "K | Quellen": f"{self.base}/redirect/1-x\n{self.base}/busy\n{self.base}/noauth"},
+            {"Unternehmen": "C", "Status": "Fehler"},
+        ]
+
+        neu, tabelle = sources.resolve_sources(results, self.cache_path, timeout=2)
+
+        self.assertEqual(neu[0]["K | Quellen"], "Q1, Q2")
+        self.assertEqual(neu[1]["K | Quellen"], "Q2, Q3, Q4")
+        self.assertEqual(neu[2], results[2])
+        self.assertEqual(
+            [q["URL"] for q in tabelle],
+            [f"{self.base}/page/0", f"{self.base}/page/1", f"{self.base}/busy", f"{self.base}/noauth"],
+        )
+
+        cache = sources.load_source_cache(self.cache_path)
+        self.assertEqual(len(cache), 7)
+        self.assertNotIn(f"{self.base}/busy", cache)
+        self.assertNotIn(f"{self.base}/noauth", cache)
+
+        # Zweiter Lauf: aufgelöste URLs kommen aus dem Cache, nur die offenen werden erneut versucht
+        _Handler.zugriffe = []
+        neu2, tabelle2 = sources.resolve_sources(results, self.cache_path, timeout=2)
+        self.assertEqual((neu2, tabelle2), (neu, tabelle))
+        self.assertEqual(
+            sorted(pfad for _, pfad in _Handler.zugriffe),
+            ["/busy", "/noauth"],
+        )
+
+    def test_parallele_session_verliert_keine_cache_eintraege(self):
+        results = [{"Unternehmen": "A", "K | Quellen": f"{self.base}/redirect/a-1\n{self.base}/slow"}]
+        lauf = threading.Thread(target=sources.resolve_sources, args=(results, self.cache_path, 2))
+        lauf.start()
+        # Eine andere Session speichert, während dieser Lauf noch auflöst
+        time.sleep(0.3)
+        sources.save_source_cache({"https://andere.example/r": "https://andere.example/"}, self.cache_path)
+        lauf.join()
+
+        cache = sources.load_source_cache(self.cache_path)
+        self.assertEqual(cache["https://andere.example/r"], "https://andere.example/")
+        self.assertEqual(cache[f"{self.base}/redirect/a-1"], f"{self.base}/page/a")
+        self.assertIn(f"{self.base}/slow", cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
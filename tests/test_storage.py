@@ -0,0 +1,49 @@
+"""Tests der gemeinsamen JSON-Persistenz (Quellen-Cache, Laufzeit-Protokoll)."""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "daten.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_json_liefert_default_bei_fehlern(self):
+        self.assertEqual(storage.load_json(self.path, []), [])
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('[{"sekunden": 1')
+        self.assertEqual(storage.load_json(self.path, []), [])
+        storage.save_json_atomic(self.path, {"a": 1})
+        self.assertEqual(storage.load_json(self.path, []), [])
+        self.assertEqual(storage.load_json(self.path, {}), {"a": 1})
+        self.assertEqual(os.listdir(self.tmpdir.name), ["daten.json"])
+
+    def test_update_json_verliert_keine_eintraege_paralleler_sessions(self):
+        # Jede "Session" hängt nur ihre neuen Einträge an, statt ihren Startstand zurückzuschreiben
+        def session(nr):
+            for i in range(20):
+                storage.update_json(self.path, [], lambda alt: alt + [{"session": nr, "i": i}])
+
+        threads = [threading.Thread(target=session, args=(nr,)) for nr in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        eintraege = storage.load_json(self.path, [])
+        self.assertEqual(len(eintraege), 80)
+        self.assertEqual(sorted(e["i"] for e in eintraege if e["session"] == 2), list(range(20)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+"""Tests der Validierung und Nachfrage-Logik mit einem Fake-Client statt Gemini."""
+import json
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import research  # noqa: E402
+
+
+def _kriterium(category: str, name: str, scale: int = 5) -> dict:
+    return {
+        "category": category,
+        "name": name,
+        "description": f"Beschreibung {name}",
+        "scale": scale,
+        "anchor_low": "niedrig",
+        "anchor_high": "hoch",
+        "examples": [],
+    }
+
+
+def _bewertung(category: str, name: str, score, begruendung: str = "Belegt durch Geschäftsbericht.") -> dict:
+    return {"kategorie": category, "kriterium": name, "score": score, "begruendung": begruendung}
+
+
+def _antwort(*bewertungen, hinweis: str = "") -> str:
+    return json.dumps({"bewertungen": list(bewertungen), "hinweise_zur_datenlage": hinweis})
+
+
+class _FakeClient:
+    """Beantwortet jede Anfrage über antworten(prompt) -> Antworttext und merkt sich die Prompts."""
+
+    def __init__(self, antworten):
+        self.antworten = antworten
+        self.prompts = []
+        self._lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.prompts.append(contents)
+        return SimpleNamespace(
+            text=self.antworten(contents),
+            candidates=[SimpleNamespace(grounding_metadata=None)],
+            usage_metadata=SimpleNamespace(total_token_count=100),
+        )
+
+
+def _nacheinander(*texte):
+    """Antworten in fester Reihenfolge (nur für einen Shard, da sonst nebenläufig)."""
+    offen = list(texte)
+    return lambda prompt: offen.pop(0)
+
+
+class ParseScoreTest(unittest.TestCase):
+    def test_gueltige_werte(self):
+        self.assertEqual(research.parse_score(3, 5), 3)
+        self.assertEqual(research.parse_score(4.0, 5), 4)
+        self.assertEqual(research.parse_score(" 5 ", 5), 5)
+
+    def test_ausserhalb_der_skala(self):
+        for wert in (0, 6, -1, "0", "6"):
+            self.assertIsNone(research.parse_score(wert, 5), wert)
+
+    def test_ungueltige_typen(self):
+        for wert in (None, True, False, 3.5, "3.5", "drei", "1-5", "", "²", [3], {"score": 3}):
+            self.assertIsNone(research.parse_score(wert, 5), wert)
+
+
+class ValidateBewertungenTest(unittest.TestCase):
+    def setUp(self):
+        self.kriterien = [_kriterium("Markt", "Reichweite"), _kriterium("Markt", "Wachstum", scale=3)]
+
+    def test_vollstaendig_gueltig(self):
+        gueltig, offen = research.validate_bewertungen(
+            [_bewertung("Markt", "Reichweite", "4"), _bewertung("Markt", "Wachstum", 3)], self.kriterien
+        )
+        self.assertEqual(offen, [])
+        self.assertEqual([b["score"] for b in gueltig.values()], [4, 3])
+
+    def test_fehlende_und_ungueltige_scores_bleiben_offen(self):
+        faelle = [
+            [_bewertung("Markt", "Reichweite", 4)],                                 # Wachstum fehlt
+            [_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", 4)],     # außerhalb der Skala
+            [_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", None)],  # null
+            [_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", True)],  # bool
+            [_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", "hoch")],  # Text
+            [_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", 2, " ")],  # leere Begründung
+            [_bewertung("Markt", "Reichweite", 4), {"kategorie": "Markt", "kriterium": "Wachstum"}],  # ohne Score
+        ]
+        for bewertungen in faelle:
+            gueltig, offen = research.validate_bewertungen(bewertungen, self.kriterien)
+            self.assertEqual([c["name"] for c in offen], ["Wachstum"], bewertungen)
+            self.assertEqual(len(gueltig), 1)
+
+    def test_unbrauchbare_eintraege_werden_ignoriert(self):
+        bewertungen = ["text", None, {"kategorie": None, "kriterium": None, "score": 3}]
+        gueltig, offen = research.validate_bewertungen(bewertungen, self.kriterien)
+        self.assertEqual((gueltig, len(offen)), ({}, 2))
+
+    def test_schluessel_ohne_leerzeichen_und_gross_klein(self):
+        kriterien = [_kriterium("Geschäftsmodell ", " Wertschöpfungstiefe")]
+        gueltig, offen = research.validate_bewertungen(
+            [_bewertung("geschäftsmodell", "Wertschöpfungstiefe ", 2)], kriterien
+        )
+        self.assertEqual(offen, [])
+        self.assertEqual(len(gueltig), 1)
+
+
+class ExtractTest(unittest.TestCase):
+    def test_abgeschnittenes_json_wird_teilweise_gerettet(self):
+        text = _antwort(_bewertung("Markt", "Reichweite", 4), _bewertung("Markt", "Wachstum", 2))
+        abgeschnitten = text[: text.index('"Wachstum"') + 20]
+
+        self.assertIsNone(research.extract_json(abgeschnitten))
+        gerettet = research.extract_bewertungen_teilweise(abgeschnitten)
+        self.assertEqual([b["kriterium"] for b in gerettet], ["Reichweite"])
+
+    def test_json_mit_text_drumherum(self):
+        text = "Hier die Bewertung:\n```json\n" + _antwort(_bewertung("Markt", "Reichweite", 4)) + "\n```"
+        self.assertEqual(research.extract_json(text)["bewertungen"][0]["score"], 4)
+
+    def test_kein_json(self):
+        self.assertIsNone(research.extract_json("Keine Daten gefunden."))
+        self.assertEqual(research.extract_bewertungen_teilweise(None), [])
+
+
+class SelectExamplesTest(unittest.TestCase):
+    def test_zu_langes_einziges_beispiel_wird_gekuerzt(self):
+        auswahl = research.select_examples("N26", [{"company": "Alpha", "score": 2, "reason": "x" * 1300}])
+
+        self.assertEqual(len(auswahl), 1)
+        self.assertTrue(auswahl[0]["reason"].endswith("…"))
+        self.assertLessEqual(
+            research.estimate_tokens(research.format_example(auswahl[0])), research.BEISPIEL_TOKEN_BUDGET
+        )
+
+    def test_anker_ohne_aehnliche_namen(self):
+        beispiele = [
+            {"company": "Alpha", "score": 3, "reason": "a"},
+            {"company": "Beta", "score": 1, "reason": "b"},
+            {"company": "Gamma", "score": 5, "reason": "c"},
+            {"company": "Delta", "score": 3, "reason": "d"},
+        ]
+        auswahl = research.select_examples("N26", beispiele, k=2)
+        self.assertEqual(sorted(ex["score"] for ex in auswahl), [1, 5])
+
+
+class AnalyseCompanyTest(unittest.TestCase):
+    def setUp(self):
+        self.kriterien = [
+            _kriterium("Markt", "Reichweite"),
+            _kriterium("Markt", "Wachstum", scale=3),
+            _kriterium("Technologie", "Plattform"),
+        ]
+
+    def _analyse(self, client, shards=None, kriterien=None):
+        protokoll = []
+        row, log = research.analyse_company(
+            client, None, "N26", kriterien or self.kriterien, shards, protokoll
+        )
+        return row, log, protokoll
+
+    def test_nachfrage_korrigiert_nur_einen_teil(self):
+        client = _FakeClient(_nacheinander(
+            _antwort(
+                _bewertung("Markt", "Reichweite", 4),
+                _bewertung("Markt", "Wachstum", 5),
+                hinweis="Wenig Daten.",
+            ),
+            _antwort(_bewertung("Markt", "Wachstum", 2), _bewertung("Technologie", "Plattform", "sehr gut")),
+        ))
+
+        row, log, protokoll = self._analyse(client)
+
+        self.assertEqual(len(client.prompts), 2)
+        nachfrage = client.prompts[1]
+        self.assertIn("Wachstum", nachfrage)
+        self.assertIn("Plattform", nachfrage)
+        self.assertNotIn("Reichweite", nachfrage)
+        self.assertIn("<rolle>", nachfrage)
+        self.assertIn("relativ zum Marktumfeld", nachfrage)
+
+        self.assertEqual(row["Markt - Reichweite | Score"], 4)
+        self.assertEqual(row["Markt - Wachstum | Score"], 2)
+        self.assertEqual(row["Technologie - Plattform | Score"], "")
+        self.assertEqual(row["Technologie - Plattform | Begründung"], "")
+        self.assertEqual(row["Status"], "Unvollständig: 1 Kriterien ohne gültige Bewertung")
+        self.assertEqual(row["Hinweise Datenlage"], "Wenig Daten.")
+        self.assertTrue(log.startswith("Unvollständig"))
+        self.assertEqual([e["kriterien"] for e in protokoll], [3, 2])
+
+    def test_abgeschnittene_antwort_und_nachfrage(self):
+        text = _antwort(
+            _bewertung("Markt", "Reichweite", 4),
+            _bewertung("Markt", "Wachstum", 1),
+            _bewertung("Technologie", "Plattform", 3),
+        )
+        client = _FakeClient(_nacheinander(
+            text[: text.index('"Plattform"')],
+            _antwort(_bewertung("Technologie", "Plattform", 3)),
+        ))
+
+        row, log, _ = self._analyse(client)
+
+        self.assertEqual(row["Status"], "OK")
+        self.assertEqual(log, "Erfolg: N26")
+        self.assertEqual(
+            [row[f"{k} | Score"] for k in ("Markt - Reichweite", "Markt - Wachstum", "Technologie - Plattform")],
+            [4, 1, 3],
+        )
+
+    def test_leerzeichen_in_kategorie_ohne_nachfrage(self):
+        kriterien = [_kriterium("Geschäftsmodell ", "Wertschöpfungstiefe")]
+        # Das Modell übernimmt die Vorlage aus dem Prompt, aber ohne Leerzeichen am Rand
+        client = _FakeClient(lambda prompt: _antwort(_bewertung("Geschäftsmodell", "Wertschöpfungstiefe", 3)))
+
+        row, log, protokoll = self._analyse(client, kriterien=kriterien)
+
+        self.assertEqual(len(client.prompts), 1)
+        self.assertEqual(row["Status"], "OK")
+        self.assertEqual(row["Geschäftsmodell  - Wertschöpfungstiefe | Score"], 3)
+
+    def test_ohne_gueltige_bewertung_ist_fehler(self):
+        client = _FakeClient(lambda prompt: "Leider keine Informationen verfügbar.")
+
+        row, log, protokoll = self._analyse(client)
+
+        self.assertEqual(row, {"Unternehmen": "N26", "Status": "Fehler beim Auslesen der Daten"})
+        self.assertEqual(len(protokoll), 1 + research.MAX_NACHFRAGEN)
+
+    def test_shards_werden_zusammengefuehrt(self):
+        def antworten(prompt):
+            if "Plattform" in prompt:
+                return _antwort(_bewertung("Technologie", "Plattform", 5), hinweis="Technik gut belegt.")
+            return _antwort(
+                _bewertung("Markt", "Reichweite", 2), _bewertung("Markt", "Wachstum", 3), hinweis="Markt unklar."
+            )
+
+        shards = research.shard_kriterien(self.kriterien, nach_kategorie=True)
+        client = _FakeClient(antworten)
+
+        row, log, protokoll = self._analyse(client, shards=shards)
+
+        self.assertEqual(len(client.prompts), 2)
+        self.assertEqual(row["Status"], "OK")
+        self.assertEqual(row["Technologie - Plattform | Score"], 5)
+        self.assertEqual(row["Markt - Wachstum | Score"], 3)
+        self.assertEqual(row["Hinweise Datenlage"], "Markt unklar.\nTechnik gut belegt.")
+        self.assertEqual(sorted(e["kriterien"] for e in protokoll), [1, 2])
+
+    def test_fehlgeschlagener_shard_betrifft_nur_seine_kriterien(self):
+        def antworten(prompt):
+            if "Plattform" in prompt:
+                raise RuntimeError("503")
+            return _antwort(_bewertung("Markt", "Reichweite", 2), _bewertung("Markt", "Wachstum", 3))
+
+        shards = research.shard_kriterien(self.kriterien, nach_kategorie=True)
+        row, log, _ = self._analyse(_FakeClient(antworten), shards=shards)
+
+        self.assertEqual(row["Markt - Reichweite | Score"], 2)
+        self.assertEqual(row["Technologie - Plattform | Score"], "")
+        self.assertEqual(row["Status"], "Unvollständig: 1 Kriterien ohne gültige Bewertung")
+
+
+if __name__ == "__main__":
+    unittest.main()